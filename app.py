@@ -1,10 +1,11 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file, make_response
+from flask import Flask, request, jsonify, send_from_directory, send_file, make_response, Response, stream_with_context
 from flask_cors import CORS, cross_origin
-from PIL import Image
 import requests
-from io import BytesIO, StringIO
+from io import StringIO
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
 import time
 import os
 import logging
@@ -15,9 +16,29 @@ import tempfile
 from datetime import datetime
 import subprocess
 import json
+import hashlib
+import csv
+import itertools
+import zlib
 from pathlib import Path
+from urllib.parse import urlparse
+import atexit
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 
+import metrics
+import ocr
+from browser_pool import BrowserPool, PoolTimeout
+from downloads import DownloadError, fetch_image, image_from_bytes, mimetype_for
+from lru import LRUCache
+from text_store import COLUMNS as TEXT_COLUMNS, LEGACY_HEADER, TextStore, TextWriter, format_legacy_entry
+from layout_profiles import source_from_filename
+from instagram_http import obtener_imagen_http, session as http_session
+from interception import (
+    get_profile, drain_network_log, page_traffic, wait_for_response, get_response_body
+)
+
 load_dotenv()
 
 # Configure CORS
@@ -61,29 +82,114 @@ logger = logging.getLogger(__name__)
 temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
 os.makedirs(temp_dir, exist_ok=True)
 
-# Path for the text file to store all extracted text
-text_file_path = os.path.join(temp_dir, 'extracted_texts.txt')
+# Textos extraídos: una fila por extracción en SQLite (antes extracted_texts.txt)
+TEXT_STORE_PATH = os.environ.get('TEXT_STORE_PATH', os.path.join(temp_dir, 'extracted_texts.sqlite3'))
+text_store = TextStore(TEXT_STORE_PATH)
+# Las escrituras se agrupan en segundo plano; 0 escribe cada texto al momento
+text_writer = TextWriter(
+    text_store,
+    flush_interval=float(os.environ.get('TEXT_WRITER_FLUSH_INTERVAL', 0.5)),
+    max_batch=int(os.environ.get('TEXT_WRITER_MAX_BATCH', 500)),
+    put_timeout=float(os.environ.get('TEXT_WRITER_PUT_TIMEOUT', 1))
+)
+atexit.register(text_writer.close)
 
-# Ensure the text file exists
-try:
-    if not os.path.exists(text_file_path):
-        with open(text_file_path, 'w', encoding='utf-8') as f:
-            f.write('Archivo de textos extraídos\n' + '=' * 30 + '\n\n')
-except Exception as e:
-    logger.error(f'Error creating text file: {str(e)}')
+# Importar una sola vez los textos del antiguo fichero plano
+text_file_path = os.path.join(temp_dir, 'extracted_texts.txt')
+if os.path.exists(text_file_path):
+    text_store.import_legacy_file(text_file_path)
 
-def save_extracted_text(text: str):
-    """Append extracted text to the text file with a timestamp"""
+def save_extracted_text(text: str, image_hash=None, source=None, post_url=None, image_url=None, confidence=None):
+    """Queue one extracted text with its image and source metadata for the next group commit"""
     try:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(text_file_path, 'a', encoding='utf-8') as f:
-            f.write(f'\n\n--- {timestamp} ---\n')
-            f.write(text.strip())
-            f.write('\n' + '='*50 + '\n')  # Add separator between entries
+        text_writer.submit(
+            text, image_hash=image_hash, source=source, post_url=post_url,
+            image_url=image_url, confidence=confidence
+        )
     except Exception as e:
         logger.error(f'Error saving extracted text: {str(e)}')
         raise
 
+def volcar_textos_pendientes():
+    """Wait for the queued texts to be stored before reading the text store"""
+    if not text_writer.flush():
+        logger.warning('Timed out waiting for queued texts; results may miss the latest ones')
+
+def _ruta_resultado_ocr(filename):
+    return os.path.join(temp_dir, f'{filename}.ocr.json')
+
+def guardar_resultado_ocr(filename, resultado):
+    """Store the OCR result (text, regions and word-level lines) next to the saved temp image so it is never recomputed"""
+    path = _ruta_resultado_ocr(filename)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'text': resultado['text'],
+            'confidence': resultado.get('confidence'),
+            'regions': resultado.get('regions', []),
+            'lines': resultado.get('lines', []),
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def leer_resultado_ocr(filename):
+    """Return the stored OCR result for a temp image, or None if it was never OCR'd"""
+    try:
+        with open(_ruta_resultado_ocr(filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _lista_env(name, default=''):
+    return [item.strip().lower() for item in os.environ.get(name, default).split(',') if item.strip()]
+
+# Hosts (host:puerto) con los que otros clientes pueden referirse a este servicio
+SELF_HOSTS = _lista_env('SELF_HOSTS', 'localhost:5000,127.0.0.1:5000,main-app:5000')
+
+# Hosts desde los que /extract-text puede descargar imágenes ("*" permite cualquiera)
+IMAGE_URL_ALLOWLIST = _lista_env(
+    'IMAGE_URL_ALLOWLIST',
+    'cdninstagram.com,fbcdn.net,localhost,127.0.0.1,instagram-service'
+)
+
+# Imágenes guardadas recientemente, servidas desde memoria sin tocar el disco
+imagenes_recientes = LRUCache(
+    max_items=int(os.environ.get('RECENT_IMAGES_MAX_ITEMS', 64)),
+    max_size=int(os.environ.get('RECENT_IMAGES_MAX_BYTES', 64 * 1024 * 1024))
+)
+
+def archivo_local(image_url, host):
+    """Return the temp_dir filename if `image_url` is one of this service's /download/ links"""
+    parsed = urlparse(image_url)
+    hosts = {host.lower()} | set(SELF_HOSTS)
+    if parsed.netloc.lower() not in hosts or not parsed.path.startswith('/download/'):
+        return None
+    filename = os.path.basename(parsed.path)
+    if not filename or filename != parsed.path[len('/download/'):]:
+        return None
+    return filename
+
+def leer_imagen_local(filename):
+    """Return the bytes of a saved temp image from memory or disk, or None if it doesn't exist"""
+    contenido = imagenes_recientes.get(filename)
+    if contenido is not None:
+        return contenido
+    try:
+        with open(os.path.join(temp_dir, filename), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def url_permitida(image_url):
+    """Check a remote image URL against IMAGE_URL_ALLOWLIST"""
+    parsed = urlparse(image_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    if '*' in IMAGE_URL_ALLOWLIST:
+        return True
+    hostname = parsed.hostname.lower()
+    return any(hostname == allowed or hostname.endswith('.' + allowed) for allowed in IMAGE_URL_ALLOWLIST)
+
 # CORS is already configured above
 
 # Log all requests
@@ -116,7 +222,52 @@ def after_request(response):
         
     return response
 
-def obtener_imagen_instagram(url):
+# Browser pool configuration
+CHROME_POOL_SIZE = int(os.environ.get('CHROME_POOL_SIZE', 2))
+CHROME_POOL_MAX_WAIT = float(os.environ.get('CHROME_POOL_MAX_WAIT', 30))
+CHROME_POOL_MAX_USES = int(os.environ.get('CHROME_POOL_MAX_USES', 50))
+CHROME_POOL_PREWARM = os.environ.get('CHROME_POOL_PREWARM', '1') == '1'
+
+# Perfil de intercepción de recursos del navegador: none, light o strict
+CHROME_INTERCEPTION_PROFILE = os.environ.get('CHROME_INTERCEPTION_PROFILE', 'light')
+# Patrones de URL adicionales a bloquear, separados por comas (p. ej. "*.gif,*tracker.com*")
+CHROME_BLOCKED_URLS = [p.strip() for p in os.environ.get('CHROME_BLOCKED_URLS', '').split(',') if p.strip()]
+
+perfil_intercepcion = get_profile(CHROME_INTERCEPTION_PROFILE, CHROME_BLOCKED_URLS)
+
+# Reutilizar los bytes de la imagen que ya descargó el navegador (CDP Network.getResponseBody)
+CHROME_CAPTURE_IMAGE = os.environ.get('CHROME_CAPTURE_IMAGE', '1') == '1'
+CHROME_CAPTURE_TIMEOUT = float(os.environ.get('CHROME_CAPTURE_TIMEOUT', 3))
+
+# Sin imágenes en el navegador no hay nada que capturar: se descarga directamente por HTTP
+if CHROME_CAPTURE_IMAGE and perfil_intercepcion.blink_settings.get('imagesEnabled') == 'false':
+    logger.warning(f'Interception profile {perfil_intercepcion.name} blocks images; image capture disabled')
+    CHROME_CAPTURE_IMAGE = False
+
+# Intentar primero obtener la imagen por HTTP (metadatos og:image / embed)
+HTTP_FAST_PATH = os.environ.get('HTTP_FAST_PATH', '1') == '1'
+
+# Lotes de /extract-image/batch
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 50))
+BATCH_TABS_PER_BROWSER = int(os.environ.get('BATCH_TABS_PER_BROWSER', 4))
+BATCH_HTTP_CONCURRENCY = int(os.environ.get('BATCH_HTTP_CONCURRENCY', 8))
+# Imágenes procesadas a la vez en /extract-text/batch (descarga + OCR)
+BATCH_OCR_CONCURRENCY = int(os.environ.get('BATCH_OCR_CONCURRENCY', max(BATCH_HTTP_CONCURRENCY, ocr.OCR_WORKERS)))
+
+# Tiempo máximo (segundos) esperando a que aparezca la imagen del post
+PAGE_READY_TIMEOUT = float(os.environ.get('PAGE_READY_TIMEOUT', 15))
+PAGE_READY_POLL = float(os.environ.get('PAGE_READY_POLL', 0.1))
+
+# Selectores comunes de Instagram, en orden de preferencia
+SELECTORES_IMAGEN = [
+    "//img[contains(@alt, 'Photo by')]",  # Selector por atributo alt
+    "//div[contains(@class, 'x5yr21d')]//img",  # Selector por clase contenedora
+    "//div[contains(@class, '_aagv')]//img",  # Clase común para imágenes
+    "//article//img",  # Último recurso: cualquier imagen dentro de un artículo
+    "//img[contains(@src, 'scontent.cdninstagram.com')]"  # Selector por dominio de la imagen
+]
+
+def crear_driver_chrome():
     # Configurar Selenium
     chrome_options = Options()
     chrome_options.add_argument("--headless")
@@ -124,43 +275,136 @@ def obtener_imagen_instagram(url):
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--window-size=1920,1080")
+    # No esperar a que terminen de cargar todos los recursos; esperamos por la imagen
+    chrome_options.page_load_strategy = 'eager'
     
     # Configurar el navegador para parecer más real
     chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
     
-    driver = webdriver.Chrome(options=chrome_options)
+    # Bloquear vídeo, fuentes, trackers... según el perfil configurado
+    perfil_intercepcion.apply_options(chrome_options)
     
+    driver = webdriver.Chrome(options=chrome_options)
+    try:
+        perfil_intercepcion.apply_driver(driver)
+    except Exception:
+        driver.quit()
+        raise
+    return driver
+
+# Pool de navegadores reutilizables (se evita lanzar Chrome en cada petición)
+browser_pool = BrowserPool(
+    crear_driver_chrome,
+    size=CHROME_POOL_SIZE,
+    max_wait=CHROME_POOL_MAX_WAIT,
+    max_uses=CHROME_POOL_MAX_USES
+)
+atexit.register(browser_pool.close)
+if ocr.engine is not None:
+    atexit.register(ocr.engine.close)
+
+def _buscar_imagen(driver):
+    """Return the first img matched by SELECTORES_IMAGEN with an http src, or False"""
+    for selector in SELECTORES_IMAGEN:
+        try:
+            for element in driver.find_elements("xpath", selector):
+                src = element.get_attribute('src')
+                if src and 'http' in src:
+                    return element
+        except WebDriverException:
+            continue
+    return False
+
+def esperar_imagen(driver, timeout=None):
+    """Poll the page until a known selector yields an image, up to `timeout` seconds"""
+    timeout = PAGE_READY_TIMEOUT if timeout is None else timeout
+    start = time.monotonic()
+    try:
+        element = WebDriverWait(driver, timeout, poll_frequency=PAGE_READY_POLL).until(_buscar_imagen)
+    except TimeoutException:
+        element = None
+    elapsed = time.monotonic() - start
+
+    metrics.record_timing('page_ready_wait', elapsed)
+    if element is None:
+        metrics.incr('page_ready_timeouts')
+        logger.warning(f'No image appeared after waiting {elapsed:.2f}s')
+    else:
+        logger.info(f'Image ready after {elapsed:.2f}s')
+    return element
+
+def registrar_trafico(mensajes, url):
+    """Aggregate the requests/bytes the browser spent on the last page into /metrics"""
+    traffic = page_traffic(mensajes)
+    metrics.incr('page_loads')
+    metrics.incr('page_requests', traffic['requests'])
+    metrics.incr('page_bytes', traffic['bytes'])
+    metrics.incr('page_blocked_requests', traffic['blocked'])
+    logger.info(
+        f'Page traffic for {url}: {traffic["requests"]} requests, '
+        f'{traffic["bytes"] / 1024:.1f} KiB, {traffic["blocked"]} blocked '
+        f'(profile {perfil_intercepcion.name})'
+    )
+    return traffic
+
+def capturar_imagen(driver, img_element, img_url, mensajes):
+    """Return the image bytes the browser already fetched, or None to fall back to HTTP"""
     try:
-        # Abrir la URL
+        # With srcset the browser may have loaded a different candidate than src
+        current_src = img_element.get_attribute('currentSrc')
+    except WebDriverException:
+        current_src = None
+
+    request_id = wait_for_response(
+        driver, [img_url, current_src], mensajes, timeout=CHROME_CAPTURE_TIMEOUT
+    )
+    body = get_response_body(driver, request_id) if request_id else None
+    if not body:
+        metrics.incr('image_capture_misses')
+        logger.info(f'Image body not captured from browser, downloading {img_url}')
+        return None
+
+    metrics.incr('image_capture_hits')
+    logger.info(f'Captured {len(body) / 1024:.1f} KiB image body from the browser')
+    return body
+
+def obtener_imagen(url):
+    """
+    Get the post image via the HTTP fast path, falling back to Selenium.
+    Returns (descarga, served_by), where descarga is the ImageDownload with the original bytes.
+    """
+    if HTTP_FAST_PATH:
+        start = time.monotonic()
+        descarga = obtener_imagen_http(url)
+        metrics.record_timing('extract_http', time.monotonic() - start)
+        if descarga:
+            metrics.incr('extract_served_by_http')
+            return descarga, 'http'
+        metrics.incr('extract_http_fallbacks')
+
+    start = time.monotonic()
+    descarga = obtener_imagen_instagram(url)
+    metrics.record_timing('extract_selenium', time.monotonic() - start)
+    if descarga:
+        metrics.incr('extract_served_by_selenium')
+    return descarga, 'selenium'
+
+def obtener_imagen_instagram(url):
+    # Puede lanzar PoolTimeout si todos los navegadores están ocupados
+    with browser_pool.lease() as driver:
+        return _obtener_imagen_con_driver(driver, url)
+
+def _obtener_imagen_con_driver(driver, url):
+    try:
+        # Descartar el tráfico de páginas anteriores antes de abrir la URL
+        drain_network_log(driver)
         driver.get(url)
         
-        # Esperar a que la página cargue completamente
-        time.sleep(5)
-        
-        # Intentar diferentes selectores comunes de Instagram
-        selectores = [
-            "//img[contains(@alt, 'Photo by')]",  # Selector por atributo alt
-            "//div[contains(@class, 'x5yr21d')]//img",  # Selector por clase contenedora
-            "//div[contains(@class, '_aagv')]//img",  # Clase común para imágenes
-            "//article//img",  # Último recurso: cualquier imagen dentro de un artículo
-            "//img[contains(@src, 'scontent.cdninstagram.com')]"  # Selector por dominio de la imagen
-        ]
-        
-        img_element = None
-        for selector in selectores:
-            try:
-                elements = driver.find_elements("xpath", selector)
-                for element in elements:
-                    src = element.get_attribute('src')
-                    if src and 'http' in src:
-                        img_element = element
-                        break
-                if img_element:
-                    break
-            except:
-                continue
+        img_element = esperar_imagen(driver)
+        mensajes = drain_network_log(driver)
         
         if not img_element:
+            registrar_trafico(mensajes, url)
             # Tomar captura de pantalla para depuración
             driver.save_screenshot('debug_screenshot.png')
             print("Se ha guardado una captura de pantalla para depuración: debug_screenshot.png")
@@ -169,23 +413,63 @@ def obtener_imagen_instagram(url):
         img_url = img_element.get_attribute('src')
         if not img_url:
             raise Exception("La URL de la imagen está vacía")
-            
-        # Descargar imagen
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(img_url, headers=headers, timeout=10)
-        response.raise_for_status()
         
-        img = Image.open(BytesIO(response.content))
-        logger.info(f'Imagen descargada - Dimensiones originales: {img.width}x{img.height}')
-        return img
+        contenido = None
+        if CHROME_CAPTURE_IMAGE:
+            contenido = capturar_imagen(driver, img_element, img_url, mensajes)
+        registrar_trafico(mensajes, url)
+        
+        descarga = _descarga_desde_navegador(img_url, contenido)
+        
+        logger.info(f'Imagen descargada - {descarga.mimetype} {descarga.dimensions}, {len(descarga.data)} bytes')
+        return descarga
 
     except Exception as e:
         print(f"Error al obtener la imagen: {str(e)}")
         return None
-    finally:
-        driver.quit()
+
+def guardar_imagen_extraida(descarga, host, served_by, source=None, post_url=None):
+    """Store an extracted image in temp_dir, OCR it and build the /extract-image result"""
+    # Los bytes originales se guardan tal cual: sin volver a codificar ni perder calidad
+    with tempfile.NamedTemporaryFile(delete=False, suffix=descarga.extension, dir=temp_dir) as temp_file:
+        temp_file.write(descarga.data)
+        temp_filename = os.path.basename(temp_file.name)
+    imagenes_recientes.put(temp_filename, descarga.data)
+    
+    image_url = f'http://{host}/download/{temp_filename}'
+    logger.info(f'Imagen guardada sin recodificar: {descarga.mimetype} {descarga.dimensions} (via {served_by})')
+    
+    # Extract text using pytesseract
+    text = None
+    regions = []
+    try:
+        # La imagen solo se decodifica para el OCR
+        img = ocr.open_image(descarga.data)
+        resultado = ocr.recognize(img, source=source)
+        text, regions = resultado['text'], resultado['regions']
+        
+        # Guardar el resultado junto a la imagen para que /extract-text no repita el OCR
+        guardar_resultado_ocr(temp_filename, resultado)
+        
+        if text:
+            logger.info(f'Successfully extracted text: {text[:100]}...')  # Log first 100 chars
+            save_extracted_text(
+                text, image_hash=hashlib.sha256(descarga.data).hexdigest(), source=source,
+                post_url=post_url, image_url=image_url, confidence=resultado.get('confidence')
+            )
+        else:
+            logger.info('No text was extracted from the image')
+    except Exception as e:
+        logger.error(f'Error extracting text: {str(e)}', exc_info=True)
+        # Continue even if text extraction fails - we still want to return the image
+    
+    return {
+        'success': True,
+        'image_url': image_url,
+        'served_by': served_by,
+        'text': text,
+        'regions': regions
+    }
 
 @app.route('/extract-image', methods=['POST'])
 def extract_image():
@@ -194,58 +478,225 @@ def extract_image():
         return jsonify({'error': 'URL no proporcionada'}), 400
     
     try:
-        img = obtener_imagen_instagram(data['url'])
-        if img:
-            # Create a temporary file while preserving original image quality
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', dir=temp_dir) as temp_file:
-                # Save with maximum quality (100) and original dimensions
-                img.save(temp_file, 'JPEG', quality=100, optimize=True, progressive=True)
-                temp_filename = os.path.basename(temp_file.name)
-            
-            image_url = f'http://{request.host}/download/{temp_filename}'
-            logger.info(f'Imagen guardada con dimensiones originales: {img.width}x{img.height}')
-            
-            # Extract text using pytesseract
-            try:
-                # Convert image to RGB if it's not
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Extract text in Spanish and English
-                text = pytesseract.image_to_string(img, lang='spa+eng')
-                
-                if text and text.strip():
-                    logger.info(f'Successfully extracted text: {text[:100]}...')  # Log first 100 chars
-                    save_extracted_text(text)
-                else:
-                    logger.info('No text was extracted from the image')
-            except Exception as e:
-                logger.error(f'Error extracting text: {str(e)}', exc_info=True)
-                # Continue even if text extraction fails - we still want to return the image
-            
-            return jsonify({
-                'success': True,
-                'image_url': image_url
-            })
+        descarga, served_by = obtener_imagen(data['url'])
+        if descarga:
+            return jsonify(guardar_imagen_extraida(
+                descarga, request.host, served_by, data.get('source'), post_url=data['url']
+            ))
         else:
             return jsonify({'error': 'No se pudo extraer la imagen'}), 500
+    except PoolTimeout as e:
+        logger.warning(f'Browser pool exhausted: {str(e)}')
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f'Error processing image: {str(e)}', exc_info=True)
         return jsonify({'error': f'Error al procesar la imagen: {str(e)}'}), 500
 
+def _abrir_pestanas(driver, urls):
+    """Open each URL in its own tab without waiting for it to load. Returns {handle: url}"""
+    pestanas = {}
+    for url in urls:
+        driver.switch_to.new_window('tab')
+        # El bloqueo de URLs de CDP es por pestaña
+        perfil_intercepcion.apply_driver(driver)
+        driver.execute_script('window.location.href = arguments[0];', url)
+        pestanas[driver.current_window_handle] = url
+    return pestanas
+
+def extraer_lote_con_driver(driver, urls):
+    """
+    Load several posts in parallel tabs of one browser and return
+    {url: (img_url, captured body or None) or None}.
+
+    Navigation happens in the background for every tab at once; we then round-robin
+    over the tabs looking for the image, so one browser overlaps N page loads.
+    """
+    drain_network_log(driver)
+    # Mensajes CDP de todas las pestañas del lote, para la captura y el tráfico
+    mensajes = []
+    start = time.monotonic()
+    pendientes = _abrir_pestanas(driver, urls)
+    encontradas = {url: None for url in urls}
+
+    deadline = start + PAGE_READY_TIMEOUT
+    while pendientes and time.monotonic() < deadline:
+        for handle, url in list(pendientes.items()):
+            try:
+                driver.switch_to.window(handle)
+                element = _buscar_imagen(driver)
+                if element:
+                    img_url = element.get_attribute('src')
+                    contenido = None
+                    if img_url and CHROME_CAPTURE_IMAGE:
+                        # La pestaña sigue activa: su cuerpo de respuesta aún se puede leer por CDP
+                        contenido = capturar_imagen(driver, element, img_url, mensajes)
+                    encontradas[url] = (img_url, contenido) if img_url else None
+                    del pendientes[handle]
+            except WebDriverException as e:
+                logger.warning(f'Error checking tab for {url}: {str(e)}')
+                del pendientes[handle]
+        if pendientes:
+            time.sleep(PAGE_READY_POLL)
+
+    elapsed = time.monotonic() - start
+    metrics.record_timing('batch_tabs_wait', elapsed)
+    mensajes.extend(drain_network_log(driver))
+    registrar_trafico(mensajes, f'{len(urls)} tabs')
+    if pendientes:
+        metrics.incr('page_ready_timeouts', len(pendientes))
+    logger.info(f'Batch of {len(urls)} tabs resolved in {elapsed:.2f}s ({len(pendientes)} without image)')
+    return encontradas
+
+def _descargar_imagen(img_url):
+    descarga = fetch_image(img_url, session=http_session)
+    metrics.incr('image_http_downloads')
+    return descarga
+
+def _descarga_desde_navegador(img_url, contenido):
+    """ImageDownload from the body captured in the browser, or downloaded when there is none"""
+    if contenido is not None:
+        try:
+            return image_from_bytes(img_url, contenido)
+        except DownloadError as e:
+            # Cuerpo capturado no válido (p. ej. una respuesta de error): se descarga de nuevo
+            logger.warning(f'Captured image body rejected, downloading it instead: {str(e)}')
+    return _descargar_imagen(img_url)
+
+def _resultado_error(url, error):
+    return {'success': False, 'url': url, 'error': error}
+
+def _procesar_http(url, host, source=None):
+    """First stage of the batch: HTTP fast path only. Returns None when Selenium is needed"""
+    descarga = obtener_imagen_http(url) if HTTP_FAST_PATH else None
+    if not descarga:
+        return None
+    metrics.incr('extract_served_by_http')
+    return guardar_imagen_extraida(descarga, host, 'http', source, post_url=url)
+
+def _procesar_pestanas(urls, host, source=None):
+    """Second stage of the batch: lease one browser and resolve `urls` in its tabs"""
+    try:
+        with browser_pool.lease() as driver:
+            encontradas = extraer_lote_con_driver(driver, urls)
+    except PoolTimeout as e:
+        return [(url, _resultado_error(url, str(e))) for url in urls]
+    except Exception as e:
+        logger.error(f'Error processing batch in browser: {str(e)}', exc_info=True)
+        return [(url, _resultado_error(url, f'Error al procesar la imagen: {str(e)}')) for url in urls]
+
+    resultados = []
+    for url in urls:
+        encontrada = encontradas.get(url)
+        if not encontrada:
+            resultados.append((url, _resultado_error(url, 'No se pudo extraer la imagen')))
+            continue
+        img_url, contenido = encontrada
+        try:
+            descarga = _descarga_desde_navegador(img_url, contenido)
+            metrics.incr('extract_served_by_selenium')
+            resultados.append((url, guardar_imagen_extraida(descarga, host, 'selenium', source, post_url=url)))
+        except Exception as e:
+            logger.error(f'Error downloading {img_url}: {str(e)}')
+            resultados.append((url, _resultado_error(url, f'Error al descargar la imagen: {str(e)}')))
+    return resultados
+
+def extraer_lote(urls, host, source=None):
+    """Yield (index, result) for every URL as soon as it is done, in completion order"""
+    indices = {}
+    for i, url in enumerate(urls):
+        indices.setdefault(url, []).append(i)
+    unicas = list(indices)
+
+    def emitir(url, resultado):
+        for i in indices[url]:
+            yield i, dict(resultado, url=url)
+
+    # Etapa 1: vía rápida HTTP en paralelo. Etapa 2: los fallos van a pestañas de los
+    # navegadores del pool en cuanto se junta un grupo, sin esperar al resto de la etapa 1
+    pendientes = []
+    with ThreadPoolExecutor(max_workers=BATCH_HTTP_CONCURRENCY) as executor_http, \
+            ThreadPoolExecutor(max_workers=browser_pool.size) as executor_pestanas:
+        # Futuro -> URL de la vía rápida, o None para un grupo de pestañas
+        futuros = {executor_http.submit(_procesar_http, url, host, source): url for url in unicas}
+        http_restantes = len(futuros)
+        while futuros:
+            hechos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                url = futuros.pop(futuro)
+                if url is None:
+                    for url_grupo, resultado in futuro.result():
+                        yield from emitir(url_grupo, resultado)
+                    continue
+                http_restantes -= 1
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    logger.error(f'Error in HTTP fast path for {url}: {str(e)}')
+                    resultado = None
+                if resultado is None:
+                    pendientes.append(url)
+                else:
+                    yield from emitir(url, resultado)
+
+            while len(pendientes) >= BATCH_TABS_PER_BROWSER or (pendientes and not http_restantes):
+                grupo = pendientes[:BATCH_TABS_PER_BROWSER]
+                pendientes = pendientes[BATCH_TABS_PER_BROWSER:]
+                metrics.incr('extract_http_fallbacks', len(grupo))
+                futuros[executor_pestanas.submit(_procesar_pestanas, grupo, host, source)] = None
+
+@app.route('/extract-image/batch', methods=['POST'])
+def extract_image_batch():
+    data = request.get_json(silent=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'success': False, 'error': 'Lista de URLs no proporcionada'}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({'success': False, 'error': f'Máximo {BATCH_MAX_URLS} URLs por lote'}), 400
+    urls = [str(url).strip() for url in urls]
+
+    host = request.host
+    source = data.get('source')
+    start = time.monotonic()
+
+    if data.get('stream'):
+        # NDJSON: una línea por URL en cuanto termina
+        def generar():
+            for i, resultado in extraer_lote(urls, host, source):
+                yield json.dumps(dict(resultado, index=i)) + '\n'
+            metrics.record_timing('extract_batch', time.monotonic() - start)
+        return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
+
+    resultados = [None] * len(urls)
+    for i, resultado in extraer_lote(urls, host, source):
+        resultados[i] = resultado
+    metrics.record_timing('extract_batch', time.monotonic() - start)
+
+    return jsonify({
+        'success': True,
+        'results': resultados
+    })
+
 # Route to serve downloaded images
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
         file_path = os.path.join(temp_dir, filename)
         if os.path.exists(file_path):
-            return send_file(file_path, mimetype='image/jpeg')
+            return send_file(file_path, mimetype=mimetype_for(filename))
         else:
             return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         logger.error(f'Error serving file {filename}: {str(e)}')
         return jsonify({'error': 'Error serving file'}), 500
 
+@app.route('/ocr/<filename>')
+def get_ocr_result(filename):
+    """Stored OCR result of an image saved by /extract-image, with words, boxes and confidences"""
+    resultado = leer_resultado_ocr(os.path.basename(filename))
+    if resultado is None:
+        return jsonify({'success': False, 'error': 'No hay resultado de OCR para esta imagen'}), 404
+    return jsonify(dict(resultado, success=True))
+
 @app.route('/extract-text', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def extract_text():
@@ -257,79 +708,144 @@ def extract_text():
         response.headers.add('Access-Control-Allow-Methods', 'POST')
         return response, 200
 
+    data = request.get_json()
+    if not data or 'image_url' not in data:
+        return jsonify({'success': False, 'error': 'No se proporcionó la URL de la imagen'}), 400
+    
+    resultado, status = extraer_texto_imagen(data['image_url'], request.host, data.get('source'))
+    return jsonify(resultado), status
+
+def extraer_texto_imagen(image_ref, host, source=None):
+    """
+    OCR one image given its URL, or the ID (filename) of an image saved by /extract-image.
+    `source` is the Instagram account, inferred from thumbnail filenames when not given.
+    Returns the /extract-text result and its HTTP status.
+    """
     try:
-        data = request.get_json()
-        if not data or 'image_url' not in data:
-            return jsonify({'success': False, 'error': 'No se proporcionó la URL de la imagen'}), 400
-        
-        image_url = data['image_url']
+        if image_ref.startswith(('http://', 'https://')):
+            image_url = image_ref
+            filename = archivo_local(image_url, host)
+        else:
+            image_url = f'http://{host}/download/{image_ref}'
+            filename = image_ref if image_ref == os.path.basename(image_ref) else None
+            if not filename:
+                return {'success': False, 'error': 'Identificador de imagen no válido'}, 400
         logger.info(f'Processing image URL: {image_url}')
+        source = source or source_from_filename(urlparse(image_url).path)
         
-        # Download the image
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-        
-        # Open the image
-        img = Image.open(BytesIO(response.content))
+        # Imágenes guardadas por /extract-image ya tienen su texto extraído
+        resultado = leer_resultado_ocr(filename) if filename else None
+        if resultado is not None:
+            metrics.incr('ocr_reused_results')
+            logger.info(f'Reusing stored OCR result for {filename}')
+            if not resultado['text']:
+                return {
+                    'success': False,
+                    'error': 'No se pudo extraer texto de la imagen'
+                }, 200
+            return {
+                'success': True,
+                'text': resultado['text'],
+                'regions': resultado.get('regions', [])
+            }, 200
         
-        # Convert to RGB if needed (required by pytesseract)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        if filename:
+            # Imagen de este mismo servicio: leerla directamente sin pasar por HTTP
+            contenido = leer_imagen_local(filename)
+            if contenido is None:
+                return {'success': False, 'error': 'Imagen no encontrada'}, 404
+            metrics.incr('extract_text_local_reads')
+        else:
+            if not url_permitida(image_url):
+                logger.warning(f'Rejected image URL outside the allowlist: {image_url}')
+                return {'success': False, 'error': 'URL de imagen no permitida'}, 400
             
-        # Extract text using pytesseract
-        text = pytesseract.image_to_string(img, lang='spa+eng')
+            # Download the image (validated and size/time-bounded while streaming)
+            contenido = fetch_image(image_url, session=http_session).data
         
-        # Clean up the extracted text
-        text = text.strip()
+        # Decode only as much as the OCR needs (reduced-scale grayscale for large JPEGs)
+        img = ocr.open_image(contenido)
+        
+        # Extract text using pytesseract
+        resultado = ocr.recognize(img, source=source)
+        text = resultado['text']
         
         if not text:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'No se pudo extraer texto de la imagen'
-            })
+            }, 200
             
         logger.info(f'Successfully extracted text: {text[:100]}...')
         
         # Save the extracted text
-        save_extracted_text(text)
+        save_extracted_text(
+            text, image_hash=hashlib.sha256(contenido).hexdigest(), source=source,
+            image_url=image_url, confidence=resultado.get('confidence')
+        )
         
-        return jsonify({
+        return {
             'success': True,
-            'text': text
-        })
+            'text': text,
+            'regions': resultado['regions']
+        }, 200
         
+    except DownloadError as e:
+        logger.warning(f'Rejected image download {image_ref}: {str(e)}')
+        return {
+            'success': False,
+            'error': f'Imagen rechazada: {str(e)}'
+        }, 400
     except requests.exceptions.RequestException as e:
         logger.error(f'Error downloading image: {str(e)}')
-        return jsonify({
+        return {
             'success': False,
             'error': f'Error al descargar la imagen: {str(e)}'
-        }), 400
+        }, 400
     except Exception as e:
         logger.error(f'Error processing image: {str(e)}', exc_info=True)
-        return jsonify({
+        return {
             'success': False,
             'error': f'Error al procesar la imagen: {str(e)}'
-        }), 500
+        }, 500
+
+@app.route('/extract-text/batch', methods=['POST'])
+def extract_text_batch():
+    data = request.get_json(silent=True)
+    images = data.get('images') if isinstance(data, dict) else None
+    if not isinstance(images, list) or not images:
+        return jsonify({'success': False, 'error': 'Lista de imágenes no proporcionada'}), 400
+    if len(images) > BATCH_MAX_URLS:
+        return jsonify({'success': False, 'error': f'Máximo {BATCH_MAX_URLS} imágenes por lote'}), 400
+
+    host = request.host
+    source = data.get('source')
+    start = time.monotonic()
+
+    # Las descargas se solapan en hilos; el OCR se reparte entre los procesos de Tesseract
+    with ThreadPoolExecutor(max_workers=min(len(images), BATCH_OCR_CONCURRENCY)) as executor:
+        futuros = [executor.submit(extraer_texto_imagen, str(image).strip(), host, source) for image in images]
+        resultados = []
+        for image, futuro in zip(images, futuros):
+            resultado, status = futuro.result()
+            resultados.append(dict(resultado, image=image, status=status))
+
+    metrics.record_timing('extract_text_batch', time.monotonic() - start)
+    return jsonify({
+        'success': True,
+        'results': resultados
+    })
 
 @app.route('/analyze-texts', methods=['POST'])
 def analyze_texts():
     try:
-        # Ensure the text file exists
-        if not os.path.exists(text_file_path):
+        # Ensure there are texts to analyze, including those still queued
+        volcar_textos_pendientes()
+        if not text_store.count():
             return jsonify({
                 'success': False,
                 'error': 'No hay textos extraídos para analizar'
             }), 400
-            
-        # Check if file has content (more than just the header)
-        with open(text_file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            
-        if len(content) <= 50:  # Just the header or empty
-            return jsonify({
-                'success': False,
-                'error': 'No hay suficiente texto para analizar'
-            }), 400
         
         # Get the path to the Gemini script
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -339,12 +855,11 @@ def analyze_texts():
         # Ensure the extracted_texts.txt file is copied to the gemini directory
         gemini_text_path = os.path.join(project_dir, 'gemini', 'extracted_texts.txt')
         
-        # Copy the extracted text file to the gemini directory
-        with open(text_file_path, 'r', encoding='utf-8') as src_file:
-            text_content = src_file.read()
-            
+        # Export the stored texts to the gemini directory in the plain-text layout it reads
         with open(gemini_text_path, 'w', encoding='utf-8') as dest_file:
-            dest_file.write(text_content)
+            dest_file.write(LEGACY_HEADER)
+            for record in text_store.iter_records():
+                dest_file.write(format_legacy_entry(record))
         
         logger.info(f'Running Gemini analysis script at: {gemini_script_path}')
         
@@ -390,31 +905,151 @@ def analyze_texts():
             'error': f'Error al analizar los textos: {str(e)}'
         }), 500
 
+@app.route('/metrics')
+def get_metrics():
+    return jsonify({
+        'browser_pool': browser_pool.stats(),
+        'recent_images': imagenes_recientes.stats(),
+        'ocr': ocr.stats(),
+        'text_store': dict(text_store.stats(), writer=text_writer.stats()),
+        **metrics.snapshot()
+    })
+
+def _fecha_param(name):
+    """Read a YYYY-mm-dd[ HH:MM:SS] query parameter; raises ValueError if it is malformed"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    datetime.strptime(value, '%Y-%m-%d' if len(value) == 10 else '%Y-%m-%d %H:%M:%S')
+    return value
+
+# Formatos de /download-texts: (Content-Type completo, extensión)
+FORMATOS_TEXTOS = {
+    'txt': ('text/plain; charset=utf-8', 'txt'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+# Tamaño aproximado de cada bloque enviado al cliente
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def _formatear_textos(registros, formato):
+    """Yield the records serialized in `formato`, one string per record"""
+    if formato == 'txt':
+        yield LEGACY_HEADER
+        for record in registros:
+            yield format_legacy_entry(record)
+    elif formato == 'jsonl':
+        for record in registros:
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+    else:
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(TEXT_COLUMNS)
+        for record in registros:
+            writer.writerow([record[column] for column in TEXT_COLUMNS])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+def _en_bloques(partes, comprimir):
+    """Group small strings into ~DOWNLOAD_CHUNK_SIZE byte blocks, gzip-compressed if requested"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    bloque = []
+    tamano = 0
+    for parte in partes:
+        datos = parte.encode('utf-8')
+        bloque.append(datos)
+        tamano += len(datos)
+        if tamano >= DOWNLOAD_CHUNK_SIZE:
+            datos = b''.join(bloque)
+            bloque, tamano = [], 0
+            datos = compresor.compress(datos) if compresor else datos
+            if datos:
+                yield datos
+    datos = b''.join(bloque)
+    if compresor:
+        datos = compresor.compress(datos) + compresor.flush()
+    if datos:
+        yield datos
+
 @app.route('/download-texts')
 def download_texts():
+    """Stream the stored texts as txt (legacy layout), jsonl or csv, filtered by date range and source"""
+    formato = request.args.get('format', 'txt').lower()
+    if formato not in FORMATOS_TEXTOS:
+        return jsonify({'error': f'Formato no válido; usa uno de: {", ".join(FORMATOS_TEXTOS)}'}), 400
     try:
-        # Ensure the file exists (create empty if it doesn't)
-        if not os.path.exists(text_file_path):
-            with open(text_file_path, 'w', encoding='utf-8') as f:
-                f.write('Archivo de textos extraídos\n' + '=' * 30 + '\n\n')
-            
-        # Check if file has content (more than just the header)
-        with open(text_file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            
-        if len(content) <= 50:  # Just the header or empty
+        since = _fecha_param('since')
+        until = _fecha_param('until')
+    except ValueError:
+        return jsonify({'error': 'Fecha no válida; usa YYYY-MM-DD o YYYY-MM-DD HH:MM:SS'}), 400
+
+    try:
+        source = request.args.get('source') or None
+        volcar_textos_pendientes()
+        registros = text_store.iter_records(since=since, until=until, source=source)
+        primero = next(registros, None)
+        if primero is None:
+            if since or until or source:
+                return jsonify({'error': 'No hay textos extraídos con esos filtros'}), 404
             return jsonify({'error': 'No se han extraído textos aún'}), 404
-            
-        return send_file(
-            text_file_path,
-            mimetype='text/plain; charset=utf-8',
-            as_attachment=True,
-            download_name='textos_extraidos.txt'
-        )
+
+        comprimir = request.accept_encodings['gzip'] > 0
+        content_type, extension = FORMATOS_TEXTOS[formato]
+        headers = {
+            'Content-Disposition': f'attachment; filename=textos_extraidos.{extension}',
+            'Vary': 'Accept-Encoding'
+        }
+        if comprimir:
+            headers['Content-Encoding'] = 'gzip'
+
+        # Se lee la base por páginas y se envía por bloques: la memoria no crece con el historial
+        partes = _formatear_textos(itertools.chain([primero], registros), formato)
+        return Response(stream_with_context(_en_bloques(partes, comprimir)), content_type=content_type, headers=headers)
     except Exception as e:
         logger.error(f'Error serving text file: {str(e)}', exc_info=True)
         return jsonify({'error': f'Error al descargar los textos: {str(e)}'}), 500
 
+SEARCH_MAX_PER_PAGE = 100
+
+@app.route('/search-texts')
+def search_texts():
+    """Full-text search over the extracted texts, ranked and paginated"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'Falta el parámetro de búsqueda q'}), 400
+    if not text_store.searchable:
+        return jsonify({'success': False, 'error': 'La búsqueda de textos no está disponible'}), 503
+    try:
+        since = _fecha_param('since')
+        until = _fecha_param('until')
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(max(1, int(request.args.get('per_page', 20))), SEARCH_MAX_PER_PAGE)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parámetros no válidos (fechas YYYY-MM-DD[ HH:MM:SS], page y per_page numéricos)'}), 400
+
+    start = time.monotonic()
+    volcar_textos_pendientes()
+    total, resultados = text_store.search(
+        query, since=since, until=until, source=request.args.get('source') or None,
+        limit=per_page, offset=(page - 1) * per_page
+    )
+    metrics.record_timing('text_search', time.monotonic() - start)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'results': resultados
+    })
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_ENV') == 'development')
\ No newline at end of file
+    debug = os.environ.get('FLASK_ENV') == 'development'
+
+    # Pre-launch browsers in the background (only in the reloader child when debugging)
+    if CHROME_POOL_PREWARM and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        threading.Thread(target=browser_pool.warm, daemon=True).start()
+
+    app.run(host='0.0.0.0', port=port, debug=debug)
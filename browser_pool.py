@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no browser could be leased within the configured wait time"""
+
+
+class PoolClosed(Exception):
+    """Raised when leasing from a pool that has already been shut down"""
+
+
+class BrowserPool:
+    """
+    Bounded pool of pre-launched WebDriver sessions.
+
+    Drivers are created lazily (or up front with warm()) by `factory`, leased
+    to one request at a time, checked for health before each lease and reset
+    (extra tabs closed, cookies cleared, blank page) when returned. A driver is
+    recycled after `max_uses` leases so long-lived Chrome processes don't leak
+    memory forever.
+    """
+
+    def __init__(self, factory, size=2, max_wait=30.0, max_uses=50):
+        self._factory = factory
+        self.size = max(1, int(size))
+        self.max_wait = float(max_wait)
+        self.max_uses = max(1, int(max_uses))
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._uses = {}
+        self._created = 0
+        self._closed = False
+
+        self._stats = {
+            'leases': 0,
+            'launched': 0,
+            'discarded': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+        }
+
+    def warm(self, count=None):
+        """Launch drivers up to `count` (default: pool size) so the first requests don't pay startup"""
+        target = self.size if count is None else min(int(count), self.size)
+        launched = []
+        while True:
+            with self._cond:
+                if self._closed or self._created >= target:
+                    break
+                self._created += 1
+            try:
+                launched.append(self._launch())
+            except Exception as e:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                logger.error(f'Error pre-launching browser: {str(e)}')
+                break
+
+        with self._cond:
+            self._idle.extend(launched)
+            self._cond.notify(len(launched))
+        logger.info(f'Browser pool warmed with {len(launched)} driver(s)')
+
+    def acquire(self):
+        """Lease a healthy driver, launching one if the pool has spare capacity"""
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        while True:
+            driver = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosed('El pool de navegadores está cerrado')
+                    if self._idle:
+                        driver = self._idle.pop()
+                        break
+                    if self._created < self.size:
+                        self._created += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No hay navegadores disponibles tras esperar {self.max_wait:.0f}s'
+                        )
+                    self._cond.wait(remaining)
+
+            if driver is None:
+                try:
+                    driver = self._launch()
+                except Exception:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(driver):
+                logger.warning('Discarding unhealthy browser from pool')
+                self._discard(driver)
+                continue
+
+            with self._cond:
+                self._stats['leases'] += 1
+                self._stats['wait_seconds_total'] += time.monotonic() - start
+            return driver
+
+    def release(self, driver):
+        """Return a leased driver, resetting it or recycling it if it is worn out"""
+        with self._cond:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+            closed = self._closed
+
+        if closed or uses >= self.max_uses or not self._reset(driver):
+            self._discard(driver)
+            return
+
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        """Quit every idle driver; drivers still leased are quit when released"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'max_wait': self.max_wait,
+                'created': self._created,
+                'idle': len(self._idle),
+                'leased': self._created - len(self._idle),
+            })
+        return stats
+
+    def _launch(self):
+        t0 = time.monotonic()
+        driver = self._factory()
+        with self._cond:
+            self._uses[id(driver)] = 0
+            self._stats['launched'] += 1
+        logger.info(f'Launched pooled browser in {time.monotonic() - t0:.2f}s')
+        return driver
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f'Error quitting browser: {str(e)}')
+        with self._cond:
+            self._uses.pop(id(driver), None)
+            self._created -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            return driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(driver):
+        """Close extra tabs, clear cookies/storage and park the driver on a blank page"""
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.execute_script('try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}')
+            driver.delete_all_cookies()
+            driver.get('about:blank')
+            return True
+        except Exception as e:
+            logger.warning(f'Error resetting browser, it will be discarded: {str(e)}')
+            return False
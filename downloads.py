@@ -0,0 +1,206 @@
+import itertools
+import os
+import struct
+import time
+
+import requests
+
+DOWNLOAD_MAX_BYTES = int(os.environ.get('DOWNLOAD_MAX_BYTES', 20 * 1024 * 1024))
+DOWNLOAD_MAX_PIXELS = int(os.environ.get('DOWNLOAD_MAX_PIXELS', 40_000_000))
+DOWNLOAD_MIN_DIMENSION = int(os.environ.get('DOWNLOAD_MIN_DIMENSION', 32))
+DOWNLOAD_TIMEOUT = float(os.environ.get('DOWNLOAD_TIMEOUT', 15))
+
+# Bytes read before giving up on finding the image size (JPEG EXIF blocks can be long)
+_HEADER_BYTES = 64 * 1024
+_CHUNK_SIZE = 16 * 1024
+
+# (magic bytes, mimetype, extension)
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+]
+
+
+class DownloadError(Exception):
+    """Raised when a URL does not serve an acceptable image within the limits"""
+
+
+class ImageDownload:
+    """Raw bytes of a downloaded image with its sniffed type"""
+
+    def __init__(self, url, data, mimetype, extension, dimensions=None):
+        self.url = url
+        self.data = data
+        self.mimetype = mimetype
+        self.extension = extension
+        self.dimensions = dimensions
+
+
+def sniff_image_type(header):
+    """Return (mimetype, extension) from the first bytes of a file, or None if it isn't an image"""
+    for magic, mimetype, extension in _SIGNATURES:
+        if header.startswith(magic):
+            return mimetype, extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return None
+
+
+def mimetype_for(filename, default='image/jpeg'):
+    """Mimetype of a stored image from the extension it was saved with"""
+    extension = os.path.splitext(filename)[1].lower()
+    for _, mimetype, known in _SIGNATURES + [(None, 'image/webp', '.webp')]:
+        if extension == known:
+            return mimetype
+    return default
+
+
+def _jpeg_dimensions(header):
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        # Fill bytes and markers without a length
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        # Start-of-frame markers, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', header[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack('>H', header[i + 2:i + 4])[0]
+    return None
+
+
+def image_dimensions(header, mimetype):
+    """Width and height read from the image header, or None if the header is not complete yet"""
+    try:
+        if mimetype == 'image/png' and len(header) >= 24:
+            return struct.unpack('>II', header[16:24])
+        if mimetype == 'image/gif' and len(header) >= 10:
+            return struct.unpack('<HH', header[6:10])
+        if mimetype == 'image/webp' and len(header) >= 30:
+            chunk = header[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', header[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(header[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+        if mimetype == 'image/jpeg':
+            return _jpeg_dimensions(header)
+    except struct.error:
+        pass
+    return None
+
+
+def _check_dimensions(dimensions):
+    width, height = dimensions
+    if width < DOWNLOAD_MIN_DIMENSION or height < DOWNLOAD_MIN_DIMENSION:
+        raise DownloadError(f'Imagen demasiado pequeña ({width}x{height})')
+    if width * height > DOWNLOAD_MAX_PIXELS:
+        raise DownloadError(f'Imagen demasiado grande ({width}x{height})')
+
+
+def image_from_bytes(url, data):
+    """Wrap image bytes obtained elsewhere (e.g. captured by the browser) as an ImageDownload"""
+    kind = sniff_image_type(data[:16])
+    if kind is None:
+        raise DownloadError('El contenido descargado no es una imagen')
+    return ImageDownload(url, data, kind[0], kind[1], image_dimensions(data[:_HEADER_BYTES], kind[0]))
+
+
+def iter_image_chunks(url, session=None, max_bytes=None, timeout=None):
+    """
+    Stream an image URL, validating it before the body is read.
+
+    The Content-Type and Content-Length headers, the magic bytes and the
+    dimensions in the image header are checked first; the total size and the
+    total time are enforced while streaming. Yields (info, chunk) pairs, where
+    info is the ImageDownload (without data) of the first chunk and None after.
+    Raises DownloadError for anything that is not an acceptable image.
+    """
+    session = session or requests
+    max_bytes = DOWNLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    timeout = DOWNLOAD_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+
+    with session.get(url, stream=True, timeout=min(timeout, 10)) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and not content_type.startswith('image/') and content_type != 'application/octet-stream':
+            raise DownloadError(f'La URL no es una imagen ({content_type})')
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise DownloadError(f'Imagen demasiado grande ({int(length)} bytes)')
+
+        chunks = response.iter_content(chunk_size=_CHUNK_SIZE)
+        header = b''
+        pending = []
+        for chunk in chunks:
+            header += chunk
+            pending.append(chunk)
+            if len(header) >= _HEADER_BYTES:
+                break
+            kind = sniff_image_type(header) if len(header) >= 12 else None
+            if kind and image_dimensions(header, kind[0]):
+                break
+            if time.monotonic() > deadline:
+                raise DownloadError('Tiempo de descarga agotado')
+
+        kind = sniff_image_type(header)
+        if kind is None:
+            raise DownloadError('El contenido descargado no es una imagen')
+        dimensions = image_dimensions(header, kind[0])
+        if dimensions:
+            _check_dimensions(dimensions)
+
+        info = ImageDownload(url, None, kind[0], kind[1], dimensions)
+        received = 0
+        for chunk in itertools.chain(pending, chunks):
+            received += len(chunk)
+            if received > max_bytes:
+                raise DownloadError(f'Imagen demasiado grande (más de {max_bytes} bytes)')
+            if time.monotonic() > deadline:
+                raise DownloadError('Tiempo de descarga agotado')
+            yield info, chunk
+            info = None
+
+
+def fetch_image(url, session=None, max_bytes=None, timeout=None):
+    """
+    Download an image into memory within the limits and return an ImageDownload.
+
+    The body is buffered rather than decoded while it streams: callers keep the
+    original bytes anyway (they are stored unchanged, hashed and kept in the
+    recent-images cache), so an incremental decode would not lower peak memory,
+    which is capped by DOWNLOAD_MAX_BYTES. Use download_to_file() to stream to disk.
+    """
+    info = None
+    parts = []
+    for chunk_info, chunk in iter_image_chunks(url, session, max_bytes, timeout):
+        info = chunk_info or info
+        parts.append(chunk)
+    info.data = b''.join(parts)
+    return info
+
+
+def download_to_file(url, path, session=None, max_bytes=None, timeout=None):
+    """Stream an image to `path` within the limits; nothing is left on disk if it is rejected"""
+    tmp_path = f'{path}.part'
+    try:
+        with open(tmp_path, 'wb') as f:
+            for _, chunk in iter_image_chunks(url, session, max_bytes, timeout):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
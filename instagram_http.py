@@ -0,0 +1,116 @@
+import html
+import logging
+import os
+import re
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from downloads import fetch_image
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+_SHORTCODE_RE = re.compile(r'instagram\.com/(?:[^/?#]+/)?(p|reel|tv)/([A-Za-z0-9_-]+)')
+_META_TAG_RE = re.compile(r'<meta\b[^>]*>', re.IGNORECASE)
+_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_EMBED_IMG_RE = re.compile(
+    r'<img\b[^>]*class="[^"]*EmbeddedMediaImage[^"]*"[^>]*>', re.IGNORECASE
+)
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
+    })
+    return session
+
+
+# Shared keep-alive session; requests.Session is safe for concurrent GETs
+session = _build_session()
+
+
+def _attrs(tag):
+    return {m.group(1).lower(): m.group(2) if m.group(2) is not None else m.group(3)
+            for m in _ATTR_RE.finditer(tag)}
+
+
+def _is_post_image(url):
+    """Reject placeholders such as the Instagram logo served from static.cdninstagram.com"""
+    host = urlparse(url).netloc
+    return ('cdninstagram.com' in host or 'fbcdn.net' in host) and not host.startswith('static.')
+
+
+def find_og_image(page):
+    """Return the og:image URL declared in the page metadata, if any"""
+    for tag in _META_TAG_RE.findall(page):
+        attrs = _attrs(tag)
+        if attrs.get('property', attrs.get('name')) in ('og:image', 'og:image:secure_url'):
+            url = html.unescape(attrs.get('content') or '')
+            if url.startswith('http') and _is_post_image(url):
+                return url
+    return None
+
+
+def find_embed_image(page):
+    """Return the main image URL from the /embed/ markup, if any"""
+    for tag in _EMBED_IMG_RE.findall(page):
+        url = html.unescape(_attrs(tag).get('src') or '')
+        if url.startswith('http') and _is_post_image(url):
+            return url
+    return None
+
+
+def candidate_pages(url):
+    """Yield (page_url, parser) pairs to try for a post URL"""
+    yield url, find_og_image
+    match = _SHORTCODE_RE.search(url)
+    if match:
+        kind, shortcode = match.groups()
+        yield f'https://www.instagram.com/{kind}/{shortcode}/embed/', find_embed_image
+
+
+def find_image_url(url):
+    """Fetch the post page over plain HTTP and pull the main image URL from its markup"""
+    for page_url, parser in candidate_pages(url):
+        try:
+            response = session.get(page_url, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.info(f'HTTP fast path could not fetch {page_url}: {str(e)}')
+            continue
+
+        img_url = parser(response.text)
+        if img_url:
+            return img_url
+    return None
+
+
+def obtener_imagen_http(url):
+    """
+    Try to get the post image without a browser. Returns the downloaded bytes as an
+    ImageDownload, or None when it isn't possible.
+    """
+    img_url = find_image_url(url)
+    if not img_url:
+        logger.info(f'HTTP fast path found no image metadata for {url}')
+        return None
+
+    try:
+        descarga = fetch_image(img_url, session=session)
+    except Exception as e:
+        logger.warning(f'HTTP fast path failed downloading {img_url}: {str(e)}')
+        return None
+
+    logger.info(f'Imagen obtenida por HTTP - {descarga.mimetype} {descarga.dimensions}, {len(descarga.data)} bytes')
+    return descarga
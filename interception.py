@@ -0,0 +1,168 @@
+import base64
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Video/audio and fonts are never needed to find the post image in the DOM
+MEDIA_PATTERNS = ['*.mp4', '*.m4v', '*.m4a', '*.webm', '*.mp3', '*.ogg', '*.m3u8', '*.mpd']
+FONT_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+TRACKER_PATTERNS = [
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*doubleclick.net*',
+    '*connect.facebook.net*',
+    '*facebook.com/tr*',
+    '*/logging_client_events*',
+    '*/ajax/bz*',
+]
+
+
+class InterceptionProfile:
+    """
+    Set of Chrome options and DevTools Protocol (CDP) settings that keep the
+    headless browser from downloading resources we don't need.
+
+    `blocked_urls` are wildcard patterns for Network.setBlockedURLs,
+    `blink_settings` go to --blink-settings and `prefs` to the Chrome profile.
+    """
+
+    def __init__(self, name, blocked_urls=None, blink_settings=None, prefs=None):
+        self.name = name
+        self.blocked_urls = list(blocked_urls or [])
+        self.blink_settings = dict(blink_settings or {})
+        self.prefs = dict(prefs or {})
+
+    def with_extra_urls(self, patterns):
+        return InterceptionProfile(
+            self.name,
+            self.blocked_urls + [p for p in patterns if p not in self.blocked_urls],
+            self.blink_settings,
+            self.prefs
+        )
+
+    def apply_options(self, chrome_options):
+        """Configure launch-time settings and enable the performance log used for traffic counters"""
+        if self.blink_settings:
+            settings = ','.join(f'{k}={v}' for k, v in self.blink_settings.items())
+            chrome_options.add_argument(f'--blink-settings={settings}')
+        if self.prefs:
+            chrome_options.add_experimental_option('prefs', self.prefs)
+        chrome_options.add_argument('--mute-audio')
+        chrome_options.add_argument('--autoplay-policy=user-gesture-required')
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    def apply_driver(self, driver):
+        """Install the URL block list on the driver's current tab"""
+        driver.execute_cdp_cmd('Network.enable', {})
+        if self.blocked_urls:
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_urls})
+
+
+PROFILES = {
+    # Sin bloqueo: el navegador descarga todo como un usuario normal
+    'none': InterceptionProfile('none'),
+    # Bloquea vídeo, fuentes y trackers; las imágenes siguen cargándose
+    'light': InterceptionProfile(
+        'light',
+        blocked_urls=MEDIA_PATTERNS + FONT_PATTERNS + TRACKER_PATTERNS,
+    ),
+    # Además no descarga imágenes: el src del <img> sigue estando en el DOM
+    'strict': InterceptionProfile(
+        'strict',
+        blocked_urls=MEDIA_PATTERNS + FONT_PATTERNS + TRACKER_PATTERNS,
+        blink_settings={'imagesEnabled': 'false'},
+        prefs={'profile.managed_default_content_settings.images': 2},
+    ),
+}
+
+
+def get_profile(name, extra_urls=None):
+    """Look up a profile by name, optionally adding more blocked URL patterns"""
+    profile = PROFILES.get(name)
+    if profile is None:
+        logger.warning(f'Unknown interception profile {name!r}, using "light"')
+        profile = PROFILES['light']
+    if extra_urls:
+        profile = profile.with_extra_urls(extra_urls)
+    return profile
+
+
+def drain_network_log(driver):
+    """Read (and thereby clear) the buffered performance log as a list of CDP messages"""
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        logger.debug(f'Performance log not available: {str(e)}')
+        return []
+
+    messages = []
+    for entry in entries:
+        try:
+            messages.append(json.loads(entry['message'])['message'])
+        except (KeyError, ValueError):
+            continue
+    return messages
+
+
+def page_traffic(messages):
+    """Count requests, transferred bytes and blocked requests from CDP Network events"""
+    traffic = {'requests': 0, 'bytes': 0, 'blocked': 0}
+    for message in messages:
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            traffic['requests'] += 1
+        elif method == 'Network.loadingFinished':
+            traffic['bytes'] += int(params.get('encodedDataLength', 0))
+        elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+            traffic['blocked'] += 1
+    return traffic
+
+
+def wait_for_response(driver, urls, messages, timeout=3.0, poll=0.05):
+    """
+    Return the CDP requestId of a finished response for any of `urls`.
+
+    `messages` holds the log entries already drained for this page; entries
+    read while waiting are appended to it so traffic counters stay complete.
+    """
+    urls = set(u for u in urls if u)
+    deadline = time.monotonic() + timeout
+    candidates = set()
+    finished = set()
+    scanned = 0
+    while True:
+        for message in messages[scanned:]:
+            method = message.get('method')
+            params = message.get('params', {})
+            if method == 'Network.responseReceived':
+                response = params.get('response', {})
+                if response.get('url') in urls and response.get('status') == 200:
+                    candidates.add(params.get('requestId'))
+            elif method == 'Network.loadingFinished':
+                finished.add(params.get('requestId'))
+        scanned = len(messages)
+
+        done = candidates & finished
+        if done:
+            return next(iter(done))
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(poll)
+        messages.extend(drain_network_log(driver))
+
+
+def get_response_body(driver, request_id):
+    """Fetch a response body the browser already downloaded via CDP Network.getResponseBody"""
+    try:
+        result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+    except Exception as e:
+        logger.info(f'Response body not available for request {request_id}: {str(e)}')
+        return None
+
+    body = result.get('body', '')
+    if result.get('base64Encoded'):
+        return base64.b64decode(body)
+    return body.encode('utf-8')
@@ -0,0 +1,87 @@
+import os
+import re
+from collections import deque
+
+import numpy as np
+
+from profile_store import ProfileStore
+
+# Filenames written by instagram_service.py: <source>_<YYYYmmdd>_<HHMMSS>_<nnn>.jpg
+_THUMBNAIL_RE = re.compile(r'^([A-Za-z0-9._]+?)_\d{8}_\d{6}_\d{3}\.\w+$')
+
+
+def source_from_filename(filename):
+    """Return the Instagram account a thumbnail was fetched from, if the name encodes it"""
+    match = _THUMBNAIL_RE.match(os.path.basename(filename or ''))
+    return match.group(1).lower() if match else None
+
+
+class LayoutProfiles(ProfileStore):
+    """
+    Per-source headline band: the part of the frame where an outlet always puts
+    its headline text, as [x0, y0, x1, y1] fractions of the image size.
+
+    Bands come from the JSON file at `path` (hand-written entries have
+    "manual": true) or are learned from the text-region boxes of full-frame
+    OCR runs once `min_samples` images of a source have been seen.
+    """
+
+    kind = 'layout profiles'
+
+    def __init__(self, path, min_samples=5, max_samples=50, margin=0.03):
+        self.min_samples = int(min_samples)
+        self.margin = float(margin)
+        super().__init__(path, max_samples)
+
+    def band(self, source):
+        """Return the [x0, y0, x1, y1] band for a source, or None while unknown"""
+        if not source:
+            return None
+        with self._lock:
+            profile = self._profiles.get(source)
+            return list(profile['band']) if profile and profile.get('band') else None
+
+    def signature(self, source):
+        band = self.band(source)
+        return 'none' if band is None else ','.join(f'{v:.3f}' for v in band)
+
+    def learn(self, source, regions, size):
+        """Record the normalized text boxes of one full-frame OCR and refresh the learned band"""
+        if not source or not regions:
+            return
+        width, height = size
+        boxes = [[x / width, y / height, (x + w) / width, (y + h) / height] for x, y, w, h in regions]
+        # Union of this image's text blocks
+        sample = [min(b[0] for b in boxes), min(b[1] for b in boxes),
+                  max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+        with self._lock:
+            profile = self._profiles.setdefault(source, {'band': None, 'manual': False})
+            samples = self._samples.setdefault(source, deque(maxlen=self.max_samples))
+            samples.append([round(v, 4) for v in sample])
+            if profile.get('manual') or len(samples) < self.min_samples:
+                self._save()
+                return
+
+            # Robust vertical extent across images, ignoring the most extreme 10% on
+            # each side; learned bands span the full width since headline length varies
+            data = np.array(samples)
+            band = [
+                0.0,
+                max(0.0, float(np.percentile(data[:, 1], 10)) - self.margin),
+                1.0,
+                min(1.0, float(np.percentile(data[:, 3], 90)) + self.margin),
+            ]
+            profile['band'] = [round(v, 4) for v in band]
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                source: {
+                    'band': profile.get('band'),
+                    'manual': bool(profile.get('manual')),
+                    'samples': len(self._samples.get(source, [])),
+                }
+                for source, profile in self._profiles.items()
+            }
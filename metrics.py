@@ -0,0 +1,43 @@
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def incr(name, amount=1):
+    """Increment a named counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_timing(name, seconds):
+    """Record one duration (in seconds) for a named operation"""
+    with _lock:
+        timing = _timings.setdefault(name, {
+            'count': 0,
+            'total_seconds': 0.0,
+            'min_seconds': None,
+            'max_seconds': 0.0,
+            'last_seconds': 0.0,
+        })
+        timing['count'] += 1
+        timing['total_seconds'] += seconds
+        timing['last_seconds'] = seconds
+        timing['max_seconds'] = max(timing['max_seconds'], seconds)
+        if timing['min_seconds'] is None or seconds < timing['min_seconds']:
+            timing['min_seconds'] = seconds
+
+
+def snapshot():
+    """Return a copy of all counters and timings, with averages filled in"""
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            timing = dict(timing)
+            timing['avg_seconds'] = timing['total_seconds'] / timing['count']
+            timings[name] = timing
+        return {
+            'counters': dict(_counters),
+            'timings': timings,
+        }
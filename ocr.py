@@ -0,0 +1,527 @@
+import logging
+import os
+import random
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import pytesseract
+from PIL import Image
+
+import metrics
+from ocr_cache import OCRCache, image_key
+from layout_profiles import LayoutProfiles
+from ocr_profiles import OCRProfiles
+from preprocessing import PreprocessConfig, preprocess, to_gray
+from text_regions import (
+    RegionConfig, TextCheckConfig, detect_text_regions, regions_worth_cropping, text_score
+)
+from tesseract_engine import TesseractEngine, parse_config
+
+logger = logging.getLogger(__name__)
+
+# Paralelizamos por procesos; cada Tesseract debe usar un solo hilo para no sobrecargar la CPU
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+OCR_LANG = os.environ.get('OCR_LANG', 'spa+eng')
+OCR_CONFIG = os.environ.get('OCR_CONFIG', '')
+
+# auto: usa tesserocr si está instalado; tesserocr / pytesseract fuerzan un backend
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+
+# Limpieza de la imagen antes del OCR (escala de grises, tamaño, umbral, enderezado)
+preprocess_config = PreprocessConfig.from_env()
+# Detección de zonas con texto: Tesseract solo recibe esos recortes
+region_config = RegionConfig.from_env()
+# Comprobación rápida de si la imagen tiene texto antes de llamar a Tesseract
+text_check_config = TextCheckConfig.from_env()
+
+# Franjas de titular por fuente (aprendidas o configuradas a mano en el JSON)
+OCR_LAYOUT_PROFILES = os.environ.get('OCR_LAYOUT_PROFILES', '1') == '1'
+OCR_LAYOUT_PROFILES_PATH = os.environ.get(
+    'OCR_LAYOUT_PROFILES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'layout_profiles.json')
+)
+
+# Idioma y modo de segmentación aprendidos por fuente con sus primeras imágenes
+OCR_SOURCE_PROFILES = os.environ.get('OCR_SOURCE_PROFILES', '1') == '1'
+OCR_SOURCE_PROFILES_PATH = os.environ.get(
+    'OCR_SOURCE_PROFILES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'ocr_profiles.json')
+)
+OCR_SOURCE_PROFILE_PSMS = [
+    int(psm) for psm in os.environ.get('OCR_SOURCE_PROFILE_PSMS', '6,11,3').split(',') if psm.strip()
+]
+
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE', '1') == '1'
+OCR_CACHE_PATH = os.environ.get(
+    'OCR_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'ocr_cache.sqlite3')
+)
+
+cache = None
+if OCR_CACHE_ENABLED:
+    os.makedirs(os.path.dirname(OCR_CACHE_PATH), exist_ok=True)
+    cache = OCRCache(
+        disk_path=OCR_CACHE_PATH,
+        memory_items=int(os.environ.get('OCR_CACHE_MEMORY_ITEMS', 512)),
+        memory_size=int(os.environ.get('OCR_CACHE_MEMORY_BYTES', 8 * 1024 * 1024)),
+        disk_max_bytes=int(os.environ.get('OCR_CACHE_DISK_BYTES', 256 * 1024 * 1024))
+    )
+
+layouts = None
+if OCR_LAYOUT_PROFILES:
+    os.makedirs(os.path.dirname(OCR_LAYOUT_PROFILES_PATH), exist_ok=True)
+    layouts = LayoutProfiles(
+        OCR_LAYOUT_PROFILES_PATH,
+        min_samples=int(os.environ.get('OCR_LAYOUT_MIN_SAMPLES', 5))
+    )
+
+profiles = None
+if OCR_SOURCE_PROFILES:
+    os.makedirs(os.path.dirname(OCR_SOURCE_PROFILES_PATH), exist_ok=True)
+    profiles = OCRProfiles(
+        OCR_SOURCE_PROFILES_PATH,
+        min_samples=int(os.environ.get('OCR_SOURCE_PROFILE_SAMPLES', 5)),
+        recheck_every=int(os.environ.get('OCR_SOURCE_PROFILE_RECHECK', 200))
+    )
+    # Las imágenes de calibración se puntúan de una en una, fuera de la petición
+    _calibration_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ocr-calibration')
+
+# Guarda también palabras, cajas, líneas y confianzas (salida tipo TSV de Tesseract)
+OCR_STRUCTURED = os.environ.get('OCR_STRUCTURED', '1') == '1'
+
+# OCR por niveles: primero una pasada rápida (un idioma, segmentación dispersa);
+# solo se repite con OCR_LANG/OCR_CONFIG si la confianza media queda por debajo del umbral
+OCR_TIERS = os.environ.get('OCR_TIERS', '1') == '1'
+OCR_FAST_LANG = os.environ.get('OCR_FAST_LANG', 'spa')
+# Valores por defecto de esa pasada: solo se aplican las opciones (--psm, --tessdata-dir, -c)
+# que la configuración de la llamada no fija ya. Añadir --tessdata-dir apuntando a los
+# modelos tessdata_fast para acelerar más esta pasada
+OCR_FAST_CONFIG = os.environ.get('OCR_FAST_CONFIG', '--psm 11')
+OCR_TIER_MIN_CONFIDENCE = float(os.environ.get('OCR_TIER_MIN_CONFIDENCE', 70))
+
+# Limita los procesos de pytesseract simultáneos al número de núcleos configurado
+_pytesseract_slots = threading.BoundedSemaphore(OCR_WORKERS)
+
+engine = None
+if OCR_BACKEND in ('auto', 'tesserocr'):
+    if TesseractEngine.available():
+        engine = TesseractEngine(OCR_WORKERS, OCR_LANG, OCR_CONFIG)
+    elif OCR_BACKEND == 'tesserocr':
+        logger.warning('OCR_BACKEND=tesserocr but tesserocr is not installed; using pytesseract')
+
+
+def _pytesseract_words(img, lang, config):
+    """Words of an image from pytesseract's TSV output, in the engine's format"""
+    with _pytesseract_slots:
+        data = pytesseract.image_to_data(img, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+    words = []
+    lines = {}
+    blocks = {}
+    for i, level in enumerate(data['level']):
+        text = (data['text'][i] or '').strip()
+        # Level 5 rows are words; the others describe pages, blocks, paragraphs and lines
+        if int(level) != 5 or not text:
+            continue
+        block = (data['block_num'][i], data['par_num'][i])
+        line = block + (data['line_num'][i],)
+        words.append({
+            'text': text,
+            'conf': round(float(data['conf'][i]), 1),
+            'box': [int(data['left'][i]), int(data['top'][i]), int(data['width'][i]), int(data['height'][i])],
+            'line': lines.setdefault(line, len(lines)),
+            'block': blocks.setdefault(block, len(blocks)),
+        })
+    return words
+
+
+def _recognize_many(imgs, lang, config):
+    """Recognize several images, in parallel on the engine's workers when available"""
+    if engine is not None:
+        try:
+            futures = [engine.submit(img, lang, config) for img in imgs]
+            results = [future.result() for future in futures]
+            metrics.incr('ocr_backend_tesserocr', len(imgs))
+            return results
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died mid-task (e.g. OOM); the next calls get a fresh pool
+                engine.reset()
+            metrics.incr('ocr_backend_failures')
+            logger.warning(f'Tesseract engine failed, falling back to pytesseract: {str(e)}')
+
+    metrics.incr('ocr_backend_pytesseract', len(imgs))
+    return [_pytesseract_words(img, lang, config) for img in imgs]
+
+
+def words_to_text(words):
+    """Rebuild plain text: words joined by spaces, lines by newlines, blocks by blank lines"""
+    text = ''
+    previous = None
+    for word in words:
+        if previous is None:
+            text = word['text']
+        elif word['block'] != previous['block']:
+            text += '\n\n' + word['text']
+        elif word['line'] != previous['line']:
+            text += '\n' + word['text']
+        else:
+            text += ' ' + word['text']
+        previous = word
+    return text
+
+
+def mean_confidence(words):
+    """Mean Tesseract word confidence (0-100), or None when there are no words"""
+    confidences = [word['conf'] for word in words if word['conf'] >= 0]
+    if not confidences:
+        return None
+    return round(sum(confidences) / len(confidences), 1)
+
+
+def _to_lines(words, offset=(0, 0), scale=1.0, first_block=0):
+    """
+    Group words into lines in the compact stored format, mapping boxes from the
+    preprocessed image back to original image coordinates:
+    [{'block': n, 'box': [x, y, w, h], 'words': [[text, conf, x, y, w, h], ...]}]
+    """
+    lines = []
+    current_line = None
+    for word in words:
+        x, y, w, h = word['box']
+        box = [int(offset[0] + x * scale), int(offset[1] + y * scale), int(w * scale), int(h * scale)]
+        if not lines or word['line'] != current_line:
+            current_line = word['line']
+            lines.append({'block': first_block + word['block'], 'words': []})
+        lines[-1]['words'].append([word['text'], word['conf']] + box)
+
+    for line in lines:
+        x0 = min(word[2] for word in line['words'])
+        y0 = min(word[3] for word in line['words'])
+        x1 = max(word[2] + word[4] for word in line['words'])
+        y1 = max(word[3] + word[5] for word in line['words'])
+        line['box'] = [x0, y0, x1 - x0, y1 - y0]
+    return lines
+
+
+def _shift_lines(lines, dx, dy):
+    for line in lines:
+        line['box'] = [line['box'][0] + dx, line['box'][1] + dy] + line['box'][2:]
+        for word in line['words']:
+            word[2] += dx
+            word[3] += dy
+
+
+def _tier_signature():
+    if not OCR_TIERS:
+        return 'best'
+    return f'{OCR_FAST_LANG}:{OCR_FAST_CONFIG}:{OCR_TIER_MIN_CONFIDENCE}'
+
+
+def _fast_config(config):
+    """
+    The caller's config for the fast pass: the psm, tessdata dir and variables it
+    sets are kept, and OCR_FAST_CONFIG only fills in the ones it leaves unset.
+    """
+    tessdata_dir, psm, variables = parse_config(config)
+    fast_tessdata_dir, fast_psm, fast_variables = parse_config(OCR_FAST_CONFIG)
+    extra = []
+    if tessdata_dir is None and fast_tessdata_dir:
+        extra += ['--tessdata-dir', fast_tessdata_dir]
+    if psm is None and fast_psm is not None:
+        extra += ['--psm', str(fast_psm)]
+    names = {name for name, _ in variables}
+    for name, value in fast_variables:
+        if name not in names:
+            extra += ['-c', f'{name}={value}']
+    return ' '.join(part for part in (config, shlex.join(extra)) if part)
+
+
+def _recognize_tiered(imgs, lang, config):
+    """
+    Recognize images with the fast configuration and re-run only those whose mean
+    confidence is below OCR_TIER_MIN_CONFIDENCE with the full one.
+    Returns a list of word lists.
+    """
+    if not OCR_TIERS:
+        metrics.incr('ocr_tier_best', len(imgs))
+        return _recognize_many(imgs, lang, config)
+
+    # A single-language setting (e.g. a source profile) is already the fast model
+    fast_lang = lang if '+' not in lang else OCR_FAST_LANG
+    fast_config = _fast_config(config)
+    if (fast_lang, fast_config) == (lang, config):
+        # Both tiers would run the same OCR: one pass is all there is to do
+        metrics.incr('ocr_tier_single', len(imgs))
+        return _recognize_many(imgs, lang, config)
+
+    results = _recognize_many(imgs, fast_lang, fast_config)
+    retry = []
+    for i, words in enumerate(results):
+        confidence = mean_confidence(words)
+        if confidence is None or confidence < OCR_TIER_MIN_CONFIDENCE:
+            retry.append(i)
+    metrics.incr('ocr_tier_fast', len(imgs) - len(retry))
+    if retry:
+        metrics.incr('ocr_tier_best', len(retry))
+        for i, words in zip(retry, _recognize_many([imgs[i] for i in retry], lang, config)):
+            results[i] = words
+    return results
+
+
+def _with_psm(config, psm):
+    """Add a page segmentation mode unless the config already sets one"""
+    if '--psm' in config:
+        return config
+    return f'{config} --psm {psm}'.strip()
+
+
+def _prepare(img):
+    """
+    Return (regions, inputs): the detected text blocks, or None when the whole
+    frame should be used, and the preprocessed images Tesseract should read.
+    """
+    if region_config.enabled:
+        gray = to_gray(img)
+        start = time.monotonic()
+        regions = detect_text_regions(gray, region_config)
+        metrics.record_timing('ocr_region_detection', time.monotonic() - start)
+        if regions_worth_cropping(regions, gray.shape, region_config):
+            crops = [preprocess(img.crop((x, y, x + w, y + h)), preprocess_config) for x, y, w, h in regions]
+            return regions, crops
+        metrics.incr('ocr_full_frame')
+    return None, [preprocess(img, preprocess_config)]
+
+
+def _profile_score(words):
+    """Confidence mass of the words read above 50% confidence; noise words add nothing"""
+    return sum(max(0.0, word['conf'] - 50) / 50 for word in words)
+
+
+def _calibrate(img, lang, config, source):
+    """
+    Score every language / page segmentation candidate on one image of `source`.
+    Runs on the calibration thread and completes the sample reserved by needs_sample().
+    """
+    try:
+        _score_candidates(img, lang, config, source)
+    except Exception as e:
+        profiles.release(source)
+        logger.error(f'OCR profile calibration of {source} failed: {str(e)}')
+
+
+def _score_candidates(img, lang, config, source):
+    start = time.monotonic()
+    _, inputs = _prepare(img)
+    langs = lang.split('+')
+    if len(langs) > 1:
+        langs.append(lang)
+    # A psm fixed in the config is not something to learn
+    _, fixed_psm, _ = parse_config(config)
+    psms = [fixed_psm] if fixed_psm is not None else OCR_SOURCE_PROFILE_PSMS
+
+    scores = {}
+    for candidate_lang in langs:
+        for psm in psms:
+            results = _recognize_many(inputs, candidate_lang, _with_psm(config, psm))
+            scores[f'{candidate_lang}|{psm}'] = sum(_profile_score(words) for words in results)
+    # Normalize so every sample weighs the same in the profile vote
+    best = max(scores.values())
+    if best > 0:
+        scores = {candidate: score / best for candidate, score in scores.items()}
+    profiles.learn(source, scores)
+    metrics.incr('ocr_profile_samples')
+    metrics.record_timing('ocr_profile_calibration', time.monotonic() - start)
+
+
+def open_image(data):
+    """
+    Decode image bytes for OCR only, in the smallest form the pipeline needs:
+    JPEGs are decoded with DCT scaling to about OCR_PREPROCESS_MAX_DIMENSION and,
+    when preprocessing turns everything grayscale anyway, straight to luminance.
+    The full size is kept in img.info['original_size'] so recognize() reports
+    boxes in the coordinates of the stored image.
+    """
+    img = Image.open(BytesIO(data))
+    original = img.size
+    mode = 'L' if preprocess_config.enabled else 'RGB'
+    if img.format == 'JPEG':
+        scale = min(1.0, preprocess_config.max_dimension / max(img.size))
+        img.draft(mode, (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+        if img.size != original:
+            metrics.incr('ocr_draft_decodes')
+    if img.mode != mode:
+        img = img.convert(mode)
+    img.info['original_size'] = original
+    return img
+
+
+def recognize(img, lang=None, config=None, source=None):
+    """
+    OCR a PIL image and return {'text': ..., 'confidence': ...,
+    'regions': [{'box': [x, y, w, h], 'text': ..., 'confidence': ...}]}, plus the
+    recognized 'lines' with their words, boxes and confidences when OCR_STRUCTURED is on.
+
+    Identical content is served from the cache; otherwise only detected text
+    regions are recognized (or the full frame when detection finds nothing useful).
+    For a known `source` the source's headline band is tried first, and unless
+    `lang` / `config` are given the source's learned language and psm are used.
+    """
+    # Boxes are reported for the full-size image even when it was decoded smaller
+    original_size = tuple(img.info.get('original_size', img.size))
+
+    # Only the default settings are replaced by (and used to learn) a source profile
+    profiled = profiles is not None and bool(source) and lang is None and config is None
+    learned = profiles.profile(source) if profiled else None
+    base_lang = lang = lang or OCR_LANG
+    base_config = config = OCR_CONFIG if config is None else config
+    if learned is not None:
+        lang = learned['lang']
+        config = _with_psm(config, learned['psm'])
+
+    # Grayscale is enough when preprocessing is on; otherwise pytesseract needs RGB
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('L' if preprocess_config.enabled else 'RGB')
+
+    key = None
+    if cache is not None:
+        signature = (f'{config}|{preprocess_config.signature()}|{region_config.signature()}'
+                     f'|{text_check_config.signature()}|{_tier_signature()}|s{int(OCR_STRUCTURED)}'
+                     f'|{layouts.signature(source) if layouts is not None else "none"}'
+                     f'|{original_size[0]}x{original_size[1]}')
+        key = image_key(img, lang, signature)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    skip = text_check_config.enabled and not has_text(img)
+    # Audit a sample of the skipped images to measure false negatives
+    audit = skip and random.random() < text_check_config.audit_rate
+    if skip and not audit:
+        result = {'text': '', 'confidence': None, 'regions': [], 'skipped': True}
+        if OCR_STRUCTURED:
+            result['lines'] = []
+    else:
+        result = _recognize_with_layout(img, lang, config, source, original_size)
+        if audit:
+            metrics.incr('ocr_text_check_audits')
+            if result['text']:
+                metrics.incr('ocr_text_check_false_negatives')
+                logger.info(f'Text pre-check missed text: {result["text"][:50]}...')
+        if profiled and result['text'] and profiles.needs_sample(source):
+            _calibration_executor.submit(_calibrate, img, base_lang, base_config, source)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def has_text(img):
+    """Millisecond pre-check: False when the image almost certainly contains no text"""
+    start = time.monotonic()
+    score = text_score(to_gray(img), text_check_config.work_size)
+    metrics.record_timing('ocr_text_check', time.monotonic() - start)
+    if score < text_check_config.threshold:
+        metrics.incr('ocr_text_check_skipped')
+        logger.info(f'Skipping OCR, text score {score:.4f} below {text_check_config.threshold}')
+        return False
+    metrics.incr('ocr_text_check_passed')
+    return True
+
+
+def _scale_result(result, sx, sy):
+    """Map the boxes of a result from the decoded image to the original one"""
+    def scale(box):
+        return [int(box[0] * sx), int(box[1] * sy), int(box[2] * sx), int(box[3] * sy)]
+
+    for region in result['regions']:
+        region['box'] = scale(region['box'])
+    for line in result.get('lines', []):
+        line['box'] = scale(line['box'])
+        for word in line['words']:
+            word[2:6] = scale(word[2:6])
+
+
+def _recognize_with_layout(img, lang, config, source, original_size):
+    """
+    Try the source's headline band first; fall back to (and learn from) the full frame.
+    Boxes are returned in `original_size` coordinates.
+    """
+    scaled = original_size != img.size
+    sx, sy = original_size[0] / img.width, original_size[1] / img.height
+    band = layouts.band(source) if layouts is not None else None
+    if band:
+        x0, y0 = int(band[0] * img.width), int(band[1] * img.height)
+        x1, y1 = int(band[2] * img.width), int(band[3] * img.height)
+        result = _recognize_image(img.crop((x0, y0, x1, y1)), lang, config)
+        if result['text']:
+            metrics.incr('ocr_layout_band_hits')
+            for region in result['regions']:
+                region['box'] = [region['box'][0] + x0, region['box'][1] + y0] + region['box'][2:]
+            if OCR_STRUCTURED:
+                _shift_lines(result['lines'], x0, y0)
+            if scaled:
+                _scale_result(result, sx, sy)
+            return result
+        metrics.incr('ocr_layout_band_misses')
+        logger.info(f'Headline band of {source} gave no text, using the full image')
+
+    result = _recognize_image(img, lang, config)
+    if scaled:
+        _scale_result(result, sx, sy)
+    if layouts is not None and source and result['text']:
+        layouts.learn(source, [region['box'] for region in result['regions'] if region['text']], original_size)
+    return result
+
+
+def _recognize_image(img, lang, config):
+    start = time.monotonic()
+    regions, inputs = _prepare(img)
+    lines = []
+    if regions is None:
+        words = _recognize_tiered(inputs, lang, config)[0]
+        text = words_to_text(words)
+        confidence = mean_confidence(words)
+        if OCR_STRUCTURED:
+            lines = _to_lines(words, scale=img.width / inputs[0].width)
+        regions = []
+    else:
+        # Each crop is a single block of text
+        results = _recognize_tiered(inputs, lang, _with_psm(config, 6))
+        metrics.incr('ocr_region_crops', len(inputs))
+        if OCR_STRUCTURED:
+            for (x, y, w, _), crop, words in zip(regions, inputs, results):
+                first_block = lines[-1]['block'] + 1 if lines else 0
+                lines.extend(_to_lines(words, (x, y), w / crop.width, first_block))
+        regions = [
+            {'box': box, 'text': words_to_text(words), 'confidence': mean_confidence(words)}
+            for box, words in zip(regions, results)
+        ]
+        text = '\n'.join(region['text'] for region in regions if region['text'])
+        confidences = [region['confidence'] for region in regions if region['confidence'] is not None]
+        confidence = round(sum(confidences) / len(confidences), 1) if confidences else None
+    metrics.record_timing('ocr', time.monotonic() - start)
+    result = {'text': text, 'confidence': confidence, 'regions': regions}
+    if OCR_STRUCTURED:
+        result['lines'] = lines
+    return result
+
+
+def stats():
+    return {
+        'backend': 'tesserocr' if engine is not None else 'pytesseract',
+        'workers': engine.workers if engine is not None else None,
+        'preprocess': preprocess_config.signature(),
+        'regions': region_config.signature(),
+        'text_check': text_check_config.signature(),
+        'tiers': _tier_signature(),
+        'layouts': layouts.stats() if layouts is not None else None,
+        'profiles': profiles.stats() if profiles is not None else None,
+        'cache': cache.stats() if cache is not None else None
+    }
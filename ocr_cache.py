@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def image_key(img, lang, config=''):
+    """Cache key from the decoded pixels plus every OCR setting that changes the result"""
+    digest = hashlib.sha256()
+    digest.update(f'{img.mode}|{img.width}x{img.height}|'.encode())
+    digest.update(img.tobytes())
+    digest.update(f'|{lang}|{config}'.encode())
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Two-tier cache of OCR results keyed by image content hash.
+
+    The memory tier is an LRU bounded by item count and characters; the disk
+    tier is a SQLite table bounded by total size, evicting the least recently
+    used rows. Values are any JSON-serializable OCR result.
+    """
+
+    def __init__(self, disk_path=None, memory_items=512, memory_size=8 * 1024 * 1024,
+                 disk_max_bytes=256 * 1024 * 1024):
+        self.memory = LRUCache(max_items=memory_items, max_size=memory_size)
+        self.disk_path = disk_path
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_size = 0
+        self._stats = {'hits_memory': 0, 'hits_disk': 0, 'misses': 0, 'disk_evictions': 0}
+
+        if disk_path:
+            try:
+                self._open_disk()
+            except sqlite3.Error as e:
+                logger.error(f'OCR disk cache disabled, could not open {disk_path}: {str(e)}')
+                self._conn = None
+
+    def _open_disk(self):
+        self._conn = sqlite3.connect(self.disk_path, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS ocr_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ocr_cache_last_access ON ocr_cache (last_access)')
+        self._conn.commit()
+        self._disk_size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM ocr_cache').fetchone()[0]
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self._stats['hits_memory'] += 1
+            return value
+
+        if self._conn is not None:
+            try:
+                with self._lock:
+                    row = self._conn.execute('SELECT value FROM ocr_cache WHERE key = ?', (key,)).fetchone()
+                    if row:
+                        self._conn.execute('UPDATE ocr_cache SET last_access = ? WHERE key = ?', (time.time(), key))
+                        self._conn.commit()
+                        self._stats['hits_disk'] += 1
+                if row:
+                    value = json.loads(row[0])
+                    self.memory.put(key, value, len(row[0]))
+                    return value
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f'Error reading OCR disk cache: {str(e)}')
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        self.memory.put(key, value, len(encoded))
+        if self._conn is None:
+            return
+
+        size = len(encoded.encode('utf-8'))
+        try:
+            with self._lock:
+                old = self._conn.execute('SELECT size FROM ocr_cache WHERE key = ?', (key,)).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO ocr_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                    (key, encoded, size, time.time())
+                )
+                self._disk_size += size - (old[0] if old else 0)
+                self._evict_disk()
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f'Error writing OCR disk cache: {str(e)}')
+
+    def _evict_disk(self):
+        """Drop least recently used rows until the disk tier fits in disk_max_bytes (lock held)"""
+        while self._disk_size > self.disk_max_bytes:
+            rows = self._conn.execute(
+                'SELECT key, size FROM ocr_cache ORDER BY last_access LIMIT 64'
+            ).fetchall()
+            if not rows:
+                self._disk_size = 0
+                break
+            for key, size in rows:
+                if self._disk_size <= self.disk_max_bytes:
+                    break
+                self._conn.execute('DELETE FROM ocr_cache WHERE key = ?', (key,))
+                self._disk_size -= size
+                self._stats['disk_evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['disk_size'] = self._disk_size
+            stats['disk_max_bytes'] = self.disk_max_bytes
+        stats['hits'] = stats['hits_memory'] + stats['hits_disk']
+        stats['memory'] = self.memory.stats()
+        return stats
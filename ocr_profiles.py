@@ -0,0 +1,124 @@
+import logging
+from collections import deque
+
+from profile_store import ProfileStore
+
+logger = logging.getLogger(__name__)
+
+
+class OCRProfiles(ProfileStore):
+    """
+    Per-source Tesseract settings: the language model and page segmentation
+    mode that read a source's images best.
+
+    A profile is chosen from the candidate scores of the first `min_samples`
+    images of a source, and one more image is scored every `recheck_every`
+    images so the profile follows changes in the outlet's design. Profiles are
+    kept in the JSON file at `path`; hand-written entries have "manual": true.
+    """
+
+    kind = 'OCR profiles'
+
+    def __init__(self, path, min_samples=5, recheck_every=200, max_samples=10):
+        self.min_samples = int(min_samples)
+        self.recheck_every = int(recheck_every)
+        self._seen = {}
+        # Samples reserved by needs_sample() whose scores have not been learned yet
+        self._pending = {}
+        super().__init__(path, max(int(max_samples), self.min_samples))
+
+    def profile(self, source):
+        """Return {'lang': ..., 'psm': ...} for a source, or None while unknown"""
+        if not source:
+            return None
+        with self._lock:
+            profile = self._profiles.get(source)
+            if not profile or not profile.get('lang'):
+                return None
+            return {'lang': profile['lang'], 'psm': profile.get('psm')}
+
+    def needs_sample(self, source):
+        """
+        Count one image of `source` and tell whether it should be scored. A True
+        reserves a sample that must be completed with learn() or release().
+        """
+        if not source:
+            return False
+        with self._lock:
+            profile = self._profiles.get(source, {})
+            if profile.get('manual'):
+                return False
+            pending = self._pending.get(source, 0)
+            if len(self._samples.get(source, ())) + pending < self.min_samples:
+                self._pending[source] = pending + 1
+                return True
+            if pending:
+                # Still learning; rechecks start once the first samples are in
+                return False
+            seen = self._seen.get(source, 0) + 1
+            if seen >= self.recheck_every:
+                seen = 0
+            self._seen[source] = seen
+            if seen == 0:
+                self._pending[source] = 1
+            return seen == 0
+
+    def _release(self, source):
+        """Drop one reserved sample (lock held)"""
+        pending = self._pending.get(source, 0) - 1
+        if pending > 0:
+            self._pending[source] = pending
+        else:
+            self._pending.pop(source, None)
+
+    def release(self, source):
+        """Give back a sample reserved by needs_sample() that could not be scored"""
+        with self._lock:
+            self._release(source)
+
+    def learn(self, source, scores):
+        """
+        Record the {"lang|psm": score} results of one image and pick the
+        candidate with the best total score over the kept samples. Images
+        where no candidate read anything still count as samples.
+        """
+        if not source:
+            return
+        with self._lock:
+            self._release(source)
+            if not scores:
+                return
+            profile = self._profiles.setdefault(source, {'lang': None, 'psm': None, 'manual': False})
+            samples = self._samples.setdefault(source, deque(maxlen=self.max_samples))
+            samples.append({candidate: round(score, 2) for candidate, score in scores.items()})
+            if profile.get('manual') or len(samples) < self.min_samples:
+                self._save()
+                return
+
+            totals = {}
+            for sample in samples:
+                for candidate, score in sample.items():
+                    totals[candidate] = totals.get(candidate, 0.0) + score
+            best = max(totals, key=totals.get)
+            if totals[best] <= 0:
+                # No candidate has read anything yet; keep the defaults
+                self._save()
+                return
+            lang, psm = best.split('|')
+            if (lang, int(psm)) != (profile.get('lang'), profile.get('psm')):
+                logger.info(f'OCR profile of {source}: lang={lang} psm={psm}')
+            profile['lang'] = lang
+            profile['psm'] = int(psm)
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                source: {
+                    'lang': profile.get('lang'),
+                    'psm': profile.get('psm'),
+                    'manual': bool(profile.get('manual')),
+                    'samples': len(self._samples.get(source, [])),
+                }
+                for source, profile in self._profiles.items()
+            }
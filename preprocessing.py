@@ -0,0 +1,129 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class PreprocessConfig:
+    """Settings of the image clean-up done before OCR, read from OCR_PREPROCESS_* env vars"""
+
+    def __init__(self, enabled=True, target_text_height=32, max_dimension=2000,
+                 threshold='adaptive', block_size=31, offset=15, deskew=False):
+        self.enabled = enabled
+        self.target_text_height = int(target_text_height)
+        self.max_dimension = int(max_dimension)
+        self.threshold = threshold
+        # adaptiveThreshold needs an odd block size
+        self.block_size = int(block_size) | 1
+        self.offset = int(offset)
+        self.deskew = deskew
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get('OCR_PREPROCESS', '1') == '1',
+            target_text_height=os.environ.get('OCR_PREPROCESS_TEXT_HEIGHT', 32),
+            max_dimension=os.environ.get('OCR_PREPROCESS_MAX_DIMENSION', 2000),
+            threshold=os.environ.get('OCR_PREPROCESS_THRESHOLD', 'adaptive'),
+            block_size=os.environ.get('OCR_PREPROCESS_BLOCK_SIZE', 31),
+            offset=os.environ.get('OCR_PREPROCESS_OFFSET', 15),
+            deskew=os.environ.get('OCR_PREPROCESS_DESKEW', '0') == '1'
+        )
+
+    def signature(self):
+        """Short string identifying these settings, used in OCR cache keys"""
+        if not self.enabled:
+            return 'raw'
+        return (f'h{self.target_text_height}-m{self.max_dimension}-{self.threshold}'
+                f'-b{self.block_size}-o{self.offset}-d{int(self.deskew)}')
+
+
+def to_gray(img):
+    """PIL image -> uint8 grayscale array"""
+    if img.mode != 'L':
+        img = img.convert('L')
+    return np.asarray(img)
+
+
+def binarize(gray, config):
+    """Threshold to black text on a white background, whatever the original polarity"""
+    if config.threshold == 'none':
+        return gray
+    if config.threshold == 'otsu':
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    else:
+        binary = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+            config.block_size, config.offset
+        )
+    # Tesseract expects dark text on light background; headline bands are often inverted
+    if np.count_nonzero(binary) < binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def estimate_text_height(gray):
+    """Median height of character-sized connected components, or None if there are none"""
+    # Work on a reduced copy: component statistics don't need full resolution
+    scale = min(1.0, 800 / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    if np.count_nonzero(binary) > binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    max_height = small.shape[0] // 4
+    candidates = heights[(heights >= 4) & (heights <= max_height) & (widths <= heights * 3)]
+    if candidates.size < 5:
+        return None
+    return float(np.median(candidates)) / scale
+
+
+def resize_for_text(gray, config):
+    """Scale so typical glyphs are about target_text_height pixels tall, within max_dimension"""
+    height, width = gray.shape
+    text_height = estimate_text_height(gray)
+    factor = config.target_text_height / text_height if text_height else 1.0
+    factor = min(max(factor, 0.25), 2.0)
+    factor = min(factor, config.max_dimension / max(height, width))
+    if abs(factor - 1.0) < 0.05:
+        return gray
+    interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, None, fx=factor, fy=factor, interpolation=interpolation)
+
+
+def deskew(binary, max_angle=15.0):
+    """Rotate a black-on-white image so its text lines are horizontal"""
+    coords = np.column_stack(np.nonzero(binary == 0))
+    if coords.shape[0] < 50:
+        return binary
+    angle = cv2.minAreaRect(coords[:, ::-1].astype(np.float32))[-1]
+    # minAreaRect reports angles in [0, 90) (OpenCV >= 4.5) or [-90, 0)
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.5 or abs(angle) > max_angle:
+        return binary
+    height, width = binary.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_NEAREST,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+
+def preprocess(img, config):
+    """Run the configured pipeline and return a grayscale PIL image ready for Tesseract"""
+    if not config.enabled:
+        return img
+    gray = to_gray(img)
+    gray = resize_for_text(gray, config)
+    binary = binarize(gray, config)
+    if config.deskew and config.threshold != 'none':
+        binary = deskew(binary)
+    return Image.fromarray(binary)
@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileStore:
+    """
+    Base for per-source profiles learned from a bounded window of recent samples.
+
+    Profiles and their samples are kept in the JSON file at `path`, rewritten
+    atomically on every change; subclasses decide what a profile and a sample are.
+    """
+
+    # Used in log messages, e.g. "layout profiles"
+    kind = 'profiles'
+
+    def __init__(self, path, max_samples):
+        self.path = path
+        self.max_samples = int(max_samples)
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._samples = {}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f'Error loading {self.kind} from {self.path}: {str(e)}')
+            return
+        for source, profile in data.items():
+            self._profiles[source] = profile
+            self._samples[source] = deque(profile.get('samples', []), maxlen=self.max_samples)
+
+    def _save(self):
+        """Write all profiles atomically (lock held)"""
+        if not self.path:
+            return
+        data = {}
+        for source, profile in self._profiles.items():
+            data[source] = dict(profile, samples=list(self._samples.get(source, [])))
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f'Error saving {self.kind}: {str(e)}')
@@ -2,6 +2,7 @@ from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 import requests
 import os
+import sys
 import time
 from datetime import datetime
 import logging
@@ -20,6 +21,10 @@ INSTAGRAM_API_URL = os.environ.get('INSTAGRAM_API_URL', 'https://instagram-socia
 
 # Update the paths to be relative to the container's working directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# downloads.py vive en la raíz del repositorio (en Docker se copia junto al servicio)
+sys.path.append(os.path.dirname(BASE_DIR))
+from downloads import DownloadError, download_to_file
 PUBLIC_FOLDER = os.path.join(BASE_DIR, 'public')
 THUMBNAILS_FOLDER = os.path.join(PUBLIC_FOLDER, 'thumbnails')
 
@@ -59,14 +64,12 @@ def extract_thumbnail_urls(obj, urls=None):
 def download_thumbnail(url, save_path):
     """Download a thumbnail from the given URL and save it to the specified path."""
     try:
-        response = requests.get(url, stream=True, timeout=10)
-        response.raise_for_status()
-        
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
+        # Rejects non-images and oversized files before writing anything
+        download_to_file(url, save_path)
         return True
+    except DownloadError as e:
+        logger.warning(f"Rejected thumbnail {url}: {str(e)}")
+        return False
     except Exception as e:
         logger.error(f"Error downloading thumbnail {url}: {str(e)}")
         return False
@@ -28,9 +28,16 @@ interface ExtractTextResponse {
   error?: string;
 }
 
+interface ExtractTextBatchResponse {
+  success: boolean;
+  results?: ExtractTextResponse[];
+  error?: string;
+}
+
 interface ExtractImageResponse {
   success: boolean;
   image_url?: string;
+  text?: string | null;
   error?: string;
 }
 
@@ -136,52 +143,56 @@ export default function ImageExtractor() {
     const updatedImages = [...images];
     let hasChanges = false;
 
-    // Step 1: Extract text from images
+    // Step 1: Extract text from all images in a single batch request
     for (let i = 0; i < updatedImages.length; i++) {
-      const img = updatedImages[i];
-      console.log(`Processing image ${i + 1}/${updatedImages.length}`);
-      
-      try {
-        // Mark as processing
-        updatedImages[i] = { ...img, processing: true, error: undefined };
-        setImages([...updatedImages]);
-        
-        console.log(`Extracting text from image ${i + 1}...`);
-        const response = await axios.post<ExtractTextResponse>(
-          'http://localhost:5000/extract-text', 
-          { image_url: img.url }
-        );
+      updatedImages[i] = { ...updatedImages[i], processing: true, error: undefined };
+    }
+    setImages([...updatedImages]);
+
+    try {
+      console.log(`Extracting text from ${updatedImages.length} images...`);
+      const response = await axios.post<ExtractTextBatchResponse>(
+        'http://localhost:5000/extract-text/batch',
+        { images: updatedImages.map(img => img.url) }
+      );
+      const results = response.data.results || [];
 
-        if (response.data.success && response.data.text) {
-          const previewText = response.data.text.substring(0, 50) + (response.data.text.length > 50 ? '...' : '');
+      for (let i = 0; i < updatedImages.length; i++) {
+        const img = updatedImages[i];
+        const result = results[i];
+
+        if (result && result.success && result.text) {
+          const previewText = result.text.substring(0, 50) + (result.text.length > 50 ? '...' : '');
           console.log(`Successfully extracted text from image ${i + 1}:`, previewText);
-          
-          updatedImages[i] = { 
-            ...img, 
-            extractedText: response.data.text,
-            processing: false 
+          updatedImages[i] = {
+            ...img,
+            extractedText: result.text,
+            processing: false
           };
-          hasChanges = true;
         } else {
-          throw new Error(response.data.error || 'No se pudo extraer texto de la imagen');
+          const errorMessage = result?.error || 'No se pudo extraer texto de la imagen';
+          console.error(`Error processing image ${i + 1}:`, errorMessage);
+          updatedImages[i] = {
+            ...img,
+            error: errorMessage,
+            processing: false
+          };
         }
-      } catch (err: unknown) {
-        const errorMessage = err instanceof Error ? err.message : 'Error desconocido';
-        console.error(`Error processing image ${i + 1}:`, errorMessage);
-        updatedImages[i] = { 
-          ...img, 
-          error: errorMessage,
-          processing: false 
-        };
         hasChanges = true;
       }
-
-      // Update state after each image to show progress
-      if (hasChanges) {
-        const newImages = [...updatedImages];
-        setImages(newImages);
-        localStorage.setItem('savedInstagramImages', JSON.stringify(newImages));
+    } catch (err: unknown) {
+      const errorMessage = err instanceof Error ? err.message : 'Error desconocido';
+      console.error('Error processing images:', errorMessage);
+      for (let i = 0; i < updatedImages.length; i++) {
+        updatedImages[i] = { ...updatedImages[i], error: errorMessage, processing: false };
       }
+      hasChanges = true;
+    }
+
+    if (hasChanges) {
+      const newImages = [...updatedImages];
+      setImages(newImages);
+      localStorage.setItem('savedInstagramImages', JSON.stringify(newImages));
     }
 
     if (!hasChanges) {
@@ -253,7 +264,8 @@ export default function ImageExtractor() {
         const newImage = {
           id: Date.now().toString(),
           url: responseData.image_url,
-          timestamp: Date.now()
+          timestamp: Date.now(),
+          extractedText: responseData.text || undefined
         };
         const updatedImages = [...images, newImage];
         setImages(updatedImages);
@@ -0,0 +1,172 @@
+import logging
+import multiprocessing
+import shlex
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import tesserocr
+except ImportError:  # tesserocr is optional; pytesseract is used instead
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# Per-process cache of loaded engines, keyed by (lang, tessdata_dir)
+_apis = {}
+# Default values of the variables a request changed on each engine, to restore them
+_api_defaults = {}
+
+def parse_config(config):
+    """
+    Translate a pytesseract-style config string ("--tessdata-dir DIR --psm 6 -c name=value")
+    for tesserocr. Returns (tessdata_dir, psm, variables).
+    """
+    tessdata_dir = None
+    psm = None
+    variables = []
+    args = shlex.split(config or '')
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--psm' and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 1
+        elif arg == '--tessdata-dir' and i + 1 < len(args):
+            tessdata_dir = args[i + 1]
+            i += 1
+        elif arg == '-c' and i + 1 < len(args) and '=' in args[i + 1]:
+            variables.append(tuple(args[i + 1].split('=', 1)))
+            i += 1
+        i += 1
+    return tessdata_dir, psm, tuple(variables)
+
+
+def _get_api(lang, config):
+    """
+    Loaded engine for the model, with the page segmentation mode and variables of
+    `config`; settings left by a previous request on the same model are reset.
+    """
+    tessdata_dir, psm, variables = parse_config(config)
+    key = (lang, tessdata_dir)
+    api = _apis.get(key)
+    if api is None:
+        if tessdata_dir:
+            api = tesserocr.PyTessBaseAPI(path=tessdata_dir, lang=lang)
+        else:
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+        _apis[key] = api
+        _api_defaults[key] = {}
+
+    api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+    defaults = _api_defaults[key]
+    requested = dict(variables)
+    for name, value in defaults.items():
+        if name not in requested:
+            api.SetVariable(name, value)
+    for name, value in variables:
+        if name not in defaults:
+            default = api.GetVariableAsString(name)
+            if default is not None:
+                defaults[name] = default
+        api.SetVariable(name, value)
+    return api
+
+def _init_worker(lang, config):
+    # Load the default model once when the worker starts
+    _get_api(lang, config)
+
+
+def _recognize(mode, size, data, lang, config):
+    """
+    Worker side: rebuild the image from its raw buffer, run the loaded engine and
+    return its words as dicts with text, confidence, [x, y, w, h] box, line and block.
+    """
+    from PIL import Image
+
+    img = Image.frombytes(mode, size, data)
+    api = _get_api(lang, config)
+    api.SetImage(img)
+    api.Recognize()
+
+    words = []
+    iterator = api.GetIterator()
+    if iterator is None:
+        return words
+    level = tesserocr.RIL.WORD
+    line = block = -1
+    for word in tesserocr.iterate_level(iterator, level):
+        if word.IsAtBeginningOf(tesserocr.RIL.PARA):
+            block += 1
+        if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+            line += 1
+        text = word.GetUTF8Text(level)
+        if not text or not text.strip():
+            continue
+        x0, y0, x1, y1 = word.BoundingBox(level)
+        words.append({
+            'text': text.strip(),
+            'conf': round(word.Confidence(level), 1),
+            'box': [x0, y0, x1 - x0, y1 - y0],
+            'line': max(line, 0),
+            'block': max(block, 0),
+        })
+    return words
+
+
+class TesseractEngine:
+    """
+    Tesseract models kept loaded in long-lived worker processes (one per core).
+
+    Images are passed to the workers as raw pixel buffers, so there is neither a
+    temp file nor a tesseract process spawn per call, and traineddata is loaded
+    once per worker instead of once per image.
+    """
+
+    def __init__(self, workers, lang, config=''):
+        self.workers = max(1, int(workers))
+        self.lang = lang
+        self.config = config
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return tesserocr is not None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.lang, self.config)
+                )
+                logger.info(f'Started {self.workers} Tesseract worker(s) for {self.lang}')
+            return self._executor
+
+    def reset(self):
+        """Shut the worker pool down; the next submit() starts a fresh one"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def submit(self, img, lang=None, config=None):
+        """Queue a PIL image for recognition and return a Future with its list of words"""
+        if img.mode not in ('L', 'RGB'):
+            img = img.convert('RGB')
+        lang = lang or self.lang
+        config = self.config if config is None else config
+        try:
+            return self._get_executor().submit(_recognize, img.mode, img.size, img.tobytes(), lang, config)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next calls
+            self.reset()
+            raise
+
+    def close(self):
+        self.reset()
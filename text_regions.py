@@ -0,0 +1,165 @@
+import os
+
+import cv2
+import numpy as np
+
+
+class RegionConfig:
+    """Settings of the text-region detector, read from OCR_TEXT_REGIONS_* env vars"""
+
+    def __init__(self, enabled=True, max_regions=8, max_coverage=0.8, padding=6, work_size=1000):
+        self.enabled = enabled
+        self.max_regions = int(max_regions)
+        self.max_coverage = float(max_coverage)
+        self.padding = int(padding)
+        self.work_size = int(work_size)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get('OCR_TEXT_REGIONS', '1') == '1',
+            max_regions=os.environ.get('OCR_TEXT_REGIONS_MAX', 8),
+            max_coverage=os.environ.get('OCR_TEXT_REGIONS_MAX_COVERAGE', 0.8),
+            padding=os.environ.get('OCR_TEXT_REGIONS_PADDING', 6)
+        )
+
+    def signature(self):
+        if not self.enabled:
+            return 'full'
+        return f'r{self.max_regions}-c{self.max_coverage}-p{self.padding}-w{self.work_size}'
+
+
+def _merge_boxes(boxes, gap):
+    """Merge boxes that overlap or are within `gap` pixels, until nothing changes"""
+    boxes = [list(b) for b in boxes]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while boxes:
+            x, y, w, h = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                bx, by, bw, bh = boxes[i]
+                if (bx <= x + w + gap and x <= bx + bw + gap and
+                        by <= y + h + gap and y <= by + bh + gap):
+                    nx, ny = min(x, bx), min(y, by)
+                    w, h = max(x + w, bx + bw) - nx, max(y + h, by + bh) - ny
+                    x, y = nx, ny
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append([x, y, w, h])
+        boxes = result
+    return boxes
+
+
+def detect_text_regions(gray, config):
+    """
+    Find candidate text blocks in a grayscale array.
+
+    Morphological gradient highlights stroke edges, a wide closing joins the
+    characters of a line, and line contours with dense edge fill are grouped
+    into blocks. Returns [x, y, w, h] boxes in `gray` coordinates, top to bottom.
+    """
+    height, width = gray.shape
+    scale = min(1.0, config.work_size / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, kernel)
+    _, edges = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    line_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, small.shape[1] // 60), 1))
+    connected = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, line_kernel)
+    contours, _ = cv2.findContours(connected, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_height = max(6, small.shape[0] // 100)
+    max_height = small.shape[0] // 3
+    lines = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < min_height or h > max_height or w < h * 1.5:
+            continue
+        # Text lines are dense in edges; photo texture and gradients are not
+        fill = cv2.countNonZero(edges[y:y + h, x:x + w]) / float(w * h)
+        if fill < 0.2 or fill > 0.9:
+            continue
+        lines.append((x, y, w, h))
+
+    if not lines:
+        return []
+
+    median_height = int(np.median([h for _, _, _, h in lines]))
+    blocks = _merge_boxes(lines, gap=max(2, median_height // 2))
+
+    pad = config.padding * scale
+    regions = []
+    for x, y, w, h in blocks:
+        x0 = max(0, int((x - pad) / scale))
+        y0 = max(0, int((y - pad) / scale))
+        x1 = min(width, int((x + w + pad) / scale))
+        y1 = min(height, int((y + h + pad) / scale))
+        regions.append([x0, y0, x1 - x0, y1 - y0])
+    regions.sort(key=lambda r: (r[1], r[0]))
+    return regions
+
+
+def regions_worth_cropping(regions, shape, config):
+    """False when cropping would not save work: too many regions or they cover most of the image"""
+    if not regions or len(regions) > config.max_regions:
+        return False
+    covered = sum(w * h for _, _, w, h in regions)
+    return covered <= config.max_coverage * shape[0] * shape[1]
+
+
+class TextCheckConfig:
+    """Settings of the fast "has text?" pre-check, read from OCR_TEXT_CHECK_* env vars"""
+
+    def __init__(self, enabled=True, threshold=0.002, audit_rate=0.02, work_size=400):
+        self.enabled = enabled
+        self.threshold = float(threshold)
+        self.audit_rate = float(audit_rate)
+        self.work_size = int(work_size)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get('OCR_TEXT_CHECK', '1') == '1',
+            threshold=os.environ.get('OCR_TEXT_CHECK_THRESHOLD', 0.002),
+            audit_rate=os.environ.get('OCR_TEXT_CHECK_AUDIT_RATE', 0.02)
+        )
+
+    def signature(self):
+        if not self.enabled:
+            return 'nocheck'
+        return f't{self.threshold}-w{self.work_size}'
+
+
+def text_score(gray, work_size=400):
+    """
+    Fraction of a downscaled image covered by text-line-like edge clusters.
+
+    Pure photos score near zero: their edges are either sparse, don't form
+    horizontal runs, or are too dense (foliage, noise) to look like strokes.
+    """
+    height, width = gray.shape
+    scale = min(1.0, work_size / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, kernel)
+    # Fixed threshold: Otsu would amplify noise on flat, text-free images
+    edges = (gradient > 48).astype(np.uint8) * 255
+
+    line_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 1))
+    connected = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, line_kernel)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(connected, connectivity=8)
+    if count <= 1:
+        return 0.0
+
+    x, y, w, h, area = (stats[1:, i] for i in range(5))
+    fill = area / np.maximum(w * h, 1)
+    text_like = (h >= 4) & (h <= small.shape[0] // 4) & (w >= h * 2) & (fill >= 0.3) & (fill <= 0.95)
+    return float(np.sum(w[text_like] * h[text_like])) / small.size
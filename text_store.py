@@ -0,0 +1,354 @@
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+LEGACY_HEADER = 'Archivo de textos extraídos\n' + '=' * 30 + '\n\n'
+
+# Entries of the legacy extracted_texts.txt written by save_extracted_text
+_LEGACY_ENTRY_RE = re.compile(
+    r'--- (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) ---\n(.*?)\n={50}\n', re.DOTALL
+)
+
+COLUMNS = ('id', 'image_hash', 'source', 'post_url', 'image_url', 'created', 'text', 'confidence')
+
+# Words of a search query; everything else (FTS5 operators, quotes) is dropped
+_QUERY_TERM_RE = re.compile(r'\w+\*?')
+
+
+class TextStore:
+    """
+    SQLite table of extracted texts, one row per OCR extraction.
+
+    The database runs in WAL mode so several processes can append while others
+    read; within a process one connection is shared under a lock, and reads page
+    through the table by id so the lock is never held for a whole export.
+
+    An FTS5 index over the texts is kept up to date by triggers, with accents
+    and case folded so "accion" finds "Acción".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS extracted_texts ('
+            ' id INTEGER PRIMARY KEY,'
+            ' image_hash TEXT,'
+            ' source TEXT,'
+            ' post_url TEXT,'
+            ' image_url TEXT,'
+            ' created TEXT NOT NULL,'
+            ' text TEXT NOT NULL,'
+            ' confidence REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS extracted_texts_created ON extracted_texts (created)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS extracted_texts_source ON extracted_texts (source, created)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS extracted_texts_image_hash ON extracted_texts (image_hash)')
+        self._conn.commit()
+        self.searchable = self._create_index()
+
+    def _create_index(self):
+        """Create the full-text index and its triggers; False when SQLite lacks FTS5"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'extracted_texts_fts'"
+        ).fetchone()
+        try:
+            self._conn.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS extracted_texts_fts USING fts5('
+                " text, content='extracted_texts', content_rowid='id',"
+                " tokenize='unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError as e:
+            logger.error(f'Full-text search disabled, FTS5 not available: {str(e)}')
+            return False
+        self._conn.executescript('''
+            CREATE TRIGGER IF NOT EXISTS extracted_texts_ai AFTER INSERT ON extracted_texts BEGIN
+                INSERT INTO extracted_texts_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS extracted_texts_ad AFTER DELETE ON extracted_texts BEGIN
+                INSERT INTO extracted_texts_fts (extracted_texts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS extracted_texts_au AFTER UPDATE ON extracted_texts BEGIN
+                INSERT INTO extracted_texts_fts (extracted_texts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                INSERT INTO extracted_texts_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+        ''')
+        if not exists:
+            # Index the rows written before the index existed
+            self._conn.execute("INSERT INTO extracted_texts_fts (extracted_texts_fts) VALUES ('rebuild')")
+        self._conn.commit()
+        return True
+
+    def add_many(self, records):
+        """
+        Insert several records in a single transaction. Each record is a dict with
+        'text' and optionally image_hash, source, post_url, image_url, confidence and created.
+        """
+        rows = [
+            (r.get('image_hash'), r.get('source'), r.get('post_url'), r.get('image_url'),
+             r.get('created') or datetime.now().strftime(TIMESTAMP_FORMAT), r['text'].strip(), r.get('confidence'))
+            for r in records
+        ]
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    'INSERT INTO extracted_texts (image_hash, source, post_url, image_url, created, text, confidence)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                # All or nothing: never leave part of a batch behind
+                self._conn.rollback()
+                raise
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM extracted_texts').fetchone()[0]
+
+    def iter_records(self, since=None, until=None, source=None, batch_size=500):
+        """
+        Yield records as dicts in insertion order, optionally filtered by
+        creation time ('YYYY-mm-dd[ HH:MM:SS]', `until` inclusive) and source.
+        """
+        conditions, params = _filters(since, until, source)
+        conditions.insert(0, 'id > ?')
+        query = (f'SELECT {", ".join(COLUMNS)} FROM extracted_texts WHERE {" AND ".join(conditions)}'
+                 f' ORDER BY id LIMIT {int(batch_size)}')
+
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(query, [last_id] + params).fetchall()
+            for row in rows:
+                yield dict(zip(COLUMNS, row))
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def search(self, query, since=None, until=None, source=None, limit=20, offset=0):
+        """
+        Full-text search, best matches first. Every word of `query` must appear
+        (a trailing * matches prefixes). Returns (total, records), each record
+        with a 'snippet' where matches are wrapped in <mark></mark> and its 'score'.
+        """
+        terms = _QUERY_TERM_RE.findall(query or '')
+        if not terms:
+            return 0, []
+        match = ' '.join(f'"{term[:-1]}"*' if term.endswith('*') else f'"{term}"' for term in terms)
+
+        conditions, params = _filters(since, until, source, prefix='t.')
+        conditions.insert(0, 'extracted_texts_fts MATCH ?')
+        params.insert(0, match)
+        where = ' AND '.join(conditions)
+        columns = ', '.join(f't.{column}' for column in COLUMNS)
+        with self._lock:
+            total = self._conn.execute(
+                'SELECT COUNT(*) FROM extracted_texts_fts JOIN extracted_texts t ON t.id = extracted_texts_fts.rowid'
+                f' WHERE {where}', params
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {columns}, snippet(extracted_texts_fts, 0, '<mark>', '</mark>', '…', 16),"
+                ' bm25(extracted_texts_fts) AS score'
+                ' FROM extracted_texts_fts JOIN extracted_texts t ON t.id = extracted_texts_fts.rowid'
+                f' WHERE {where} ORDER BY score LIMIT ? OFFSET ?', params + [int(limit), int(offset)]
+            ).fetchall()
+
+        records = []
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            # bm25 is lower-is-better; expose it as higher-is-better
+            record.update(snippet=row[-2], score=round(-row[-1], 4))
+            records.append(record)
+        return total, records
+
+    def import_legacy_file(self, path):
+        """Load the entries of an old extracted_texts.txt into an empty store; returns how many"""
+        if self.count():
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            return 0
+        entries = [(created, text.strip()) for created, text in _LEGACY_ENTRY_RE.findall(content) if text.strip()]
+        if not entries:
+            return 0
+        with self._lock:
+            # Check and insert in one write transaction so concurrent workers import only once
+            self._conn.execute('BEGIN IMMEDIATE')
+            if self._conn.execute('SELECT 1 FROM extracted_texts LIMIT 1').fetchone():
+                self._conn.rollback()
+                return 0
+            self._conn.executemany('INSERT INTO extracted_texts (created, text) VALUES (?, ?)', entries)
+            self._conn.commit()
+        logger.info(f'Imported {len(entries)} texts from {path}')
+        return len(entries)
+
+    def stats(self):
+        with self._lock:
+            count, sources = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT source) FROM extracted_texts'
+            ).fetchone()
+        return {'texts': count, 'sources': sources}
+
+
+class TextWriter:
+    """
+    Group-commit writer in front of a TextStore.
+
+    Request threads only enqueue records; a background thread inserts them in
+    batches, one transaction per batch, at most every `flush_interval` seconds
+    (or as soon as `max_batch` records are waiting). A record is either fully
+    stored or not at all. With flush_interval <= 0 records are written inline,
+    as they are when the queue stays full for `put_timeout` seconds.
+    """
+
+    _STOP = object()
+
+    def __init__(self, store, flush_interval=0.5, max_batch=500, max_queue=10000, put_timeout=1.0):
+        self.store = store
+        self.flush_interval = float(flush_interval)
+        self.max_batch = int(max_batch)
+        self.put_timeout = float(put_timeout)
+        self.retry_delay = max(self.flush_interval, 1.0)
+        self.max_attempts = 5
+        self._queue = queue.Queue(maxsize=int(max_queue))
+        self._stats_lock = threading.Lock()
+        self._stats = {'written': 0, 'batches': 0, 'errors': 0, 'inline': 0}
+        self._thread = None
+        if self.flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='text-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, text, **fields):
+        """
+        Queue one record; its timestamp is taken now, not when the batch is written.
+        Raises TypeError in the caller for a record that could not be stored.
+        """
+        # A bad record must fail here, not in the batch it would share with other requests
+        if not isinstance(text, str):
+            raise TypeError(f'text must be a str, not {type(text).__name__}')
+        record = dict(fields, text=text)
+        record.setdefault('created', datetime.now().strftime(TIMESTAMP_FORMAT))
+        if self._thread is None:
+            self._write([record])
+            return
+        try:
+            # Blocks only when the queue is full, i.e. the database can't keep up
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            # The writer is stuck (e.g. a locked database): don't hold the request any longer
+            with self._stats_lock:
+                self._stats['inline'] += 1
+            self._write([record])
+
+    def flush(self, timeout=10):
+        """Wait until every record queued so far is stored; returns False on timeout"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            # The queue may be full while the writer retries a failed batch
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout=10):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def _write(self, records):
+        self.store.add_many(records)
+        with self._stats_lock:
+            self._stats['written'] += len(records)
+            self._stats['batches'] += 1
+
+    def _run(self):
+        batch = []
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            for attempt in range(1, self.max_attempts + 1):
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                    batch = []
+                except sqlite3.Error as e:
+                    with self._stats_lock:
+                        self._stats['errors'] += 1
+                    if attempt == self.max_attempts:
+                        logger.error(f'Dropping {len(batch)} texts after {attempt} failed writes: {str(e)}')
+                        batch = []
+                    else:
+                        logger.error(f'Error writing {len(batch)} texts, retrying: {str(e)}')
+                        # Keep the batch in memory; new records wait in the queue meanwhile
+                        time.sleep(self.retry_delay)
+                except Exception as e:
+                    # Not a database problem (e.g. a malformed record): retrying won't help,
+                    # but the thread must survive so later records are still written
+                    with self._stats_lock:
+                        self._stats['errors'] += 1
+                    logger.error(f'Dropping {len(batch)} texts after an unexpected error: {str(e)}', exc_info=True)
+                    batch = []
+            for waiter in waiters:
+                waiter.set()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize(), flush_interval=self.flush_interval)
+
+
+def _filters(since=None, until=None, source=None, prefix=''):
+    """SQL conditions and parameters for the creation-time range and source filters"""
+    conditions = []
+    params = []
+    if since:
+        conditions.append(f'{prefix}created >= ?')
+        params.append(since)
+    if until:
+        # A bare date includes the whole day
+        conditions.append(f'{prefix}created <= ?')
+        params.append(until if len(until) > 10 else f'{until} 23:59:59')
+    if source:
+        conditions.append(f'{prefix}source = ?')
+        params.append(source)
+    return conditions, params
+
+
+def format_legacy_entry(record):
+    """A record in the plain-text layout of the old extracted_texts.txt"""
+    return f'\n\n--- {record["created"]} ---\n{record["text"]}\n' + '=' * 50 + '\n'
+